@@ -0,0 +1,206 @@
+import asyncio
+import tempfile
+import os
+from api.retrieval import aretrieve_documents, get_query_embeddings
+from api.common import arun_chain, astream_chain, get_prompt_template, HashingSpooledFile
+from api.resources import get_async_groq_client
+from api.cache import answer_cache, transcript_cache, normalize_query, aget_collection_revision
+from api.page_store import get_content_hash, get_pdf_content_hash
+from api.single_flight import AsyncSingleFlight
+from api.context_packer import pack_context
+from api.metrics import timed
+from api.transcription import get_audio_duration, plan_segments, extract_segment, stitch_transcripts
+from api.services import (
+    Answer, Transcription, InvalidRequestError, TRANSCRIPTION_MODEL,
+    get_upload_index, is_similar_vector, chat_with_pdf_inputs
+)
+from config import config
+
+# Async variants of the RAG flows in api/services.py, served by async_app.py. They take the same requests and
+# return the same results, but wait for the embedding executor, Qdrant, the LLM and Whisper without holding a
+# thread, so one process can keep hundreds of requests in flight. Only CPU-bound steps (hashing, PDF parsing,
+# audio probing and splitting) run on worker threads. Streamed answers carry an async iterator as `tokens`.
+
+
+# The event loop has its own registries, since a flight's tokens are awaited rather than waited for
+generation_flights = AsyncSingleFlight("generation")
+chat_with_pdf_flights = AsyncSingleFlight("chat_with_pdf")
+
+
+async def generate_answer(request):
+    """
+    Async variant of `services.generate_answer`.
+    """
+    query = request.query
+
+    # Serve repeated questions from the semantic answer cache. The revision is read once, so an answer computed
+    # from the collection before an ingest() is not cached as one computed from the collection after it. It is
+    # read right before the lookup, which then finds it fresh and does not block the event loop.
+    query_vector = await get_query_embeddings().aembed_query(query)
+    revision = await aget_collection_revision()
+    answer = answer_cache.get(query_vector)
+    if answer is not None:
+        return Answer(query=query, response=answer)
+
+    async def produce():
+        results = await aretrieve_documents(query)
+        packed = pack_context(results, use_case="generation")
+        context = packed.text
+        print(f"Context packed into {packed.tokens_after} tokens, {packed.tokens_saved} saved.")
+
+        if not context:
+            return None
+
+        # Always streamed, as in `services.generate_answer`
+        inputs = {"context": context, "question": query}
+        return astream_chain(get_prompt_template("generation"), inputs)
+
+    flight = generation_flights.join(
+        ("generation", normalize_query(query), revision), produce,
+        on_complete=lambda answer: answer_cache.set(query_vector, answer, revision)
+    )
+    return await flight_answer(query, flight, request.stream)
+
+
+async def chat_with_pdf(request):
+    """
+    Async variant of `services.chat_with_pdf`.
+    """
+    query = request.query
+    file_path = request.file_path
+
+    # Validate inputs
+    if not query:
+        raise InvalidRequestError("No query provided")
+
+    if file_path and not os.path.exists(file_path):
+        raise InvalidRequestError("File not found or path invalid")
+
+    pdf_file = request.file if request.file is not None else file_path or None
+    content_hash = request.content_hash
+    if content_hash is None and pdf_file is not None:
+        content_hash = await asyncio.to_thread(get_pdf_content_hash, pdf_file)
+
+    async def produce():
+        # Search the chatbot collection with the original query while the PDF and the refined query are
+        # processed; the results are reused if the refined query turns out to be close enough
+        speculative_results = None
+        if config.CONCURRENT_CHAT_WITH_PDF:
+            speculative_results = asyncio.create_task(aretrieve_documents(query, "speculative"))
+
+        try:
+            # Step 1: Query the uploaded PDF's in-memory index, built on a worker thread on first upload
+            pdf_results = []
+            if pdf_file is not None:
+                try:
+                    index = await asyncio.to_thread(get_upload_index, pdf_file, content_hash, request.file_name)
+                finally:
+                    if holds_upload:
+                        pdf_file.close()
+                query_vector = await get_query_embeddings().aembed_query(query)
+                pdf_results = index.search(query_vector, k=3, score_threshold=0.5)
+            packed_pdf = pack_context(pdf_results, use_case="chat_with_pdf")
+            pdf_context = packed_pdf.text
+
+            # Step 2: Use LLM to generate a refined query
+            refined_query = await arun_chain(get_prompt_template("refined_query"), {"context": pdf_context, "question": query})
+            print(f"Refined query: {refined_query}")
+
+            # Step 3: Use the refined query to fetch information from the chatbot collection
+            if speculative_results is not None and await is_similar_query(query, refined_query):
+                chatbot_results = await speculative_results
+                print("Reusing the chatbot collection results of the original query.")
+            else:
+                chatbot_results = await aretrieve_documents(refined_query, "refined")
+        finally:
+            if speculative_results is not None and not speculative_results.done():
+                speculative_results.cancel()
+        packed_chatbot = pack_context(chatbot_results, use_case="chat_with_pdf")
+        chatbot_context = packed_chatbot.text
+        print(f"Context packed into {packed_pdf.tokens_after + packed_chatbot.tokens_after} tokens, "
+              f"{packed_pdf.tokens_saved + packed_chatbot.tokens_saved} saved.")
+
+        # Step 4: Combine all contexts and generate the final response
+        final_inputs = chat_with_pdf_inputs(query, refined_query, pdf_context, chatbot_context)
+        return astream_chain(get_prompt_template("chat_with_pdf"), final_inputs)
+
+    key = ("chat_with_pdf", normalize_query(query), content_hash, await aget_collection_revision())
+    # A flight started by this request reads the uploaded buffer after the request may have closed it, e.g. when
+    # its client disconnects, so the flight holds its own reference until the PDF is indexed
+    holds_upload = isinstance(pdf_file, HashingSpooledFile) and key not in chat_with_pdf_flights
+    if holds_upload:
+        pdf_file.retain()
+    flight = chat_with_pdf_flights.join(key, produce)
+    return await flight_answer(query, flight, request.stream)
+
+
+async def transcribe_audio(request):
+    """
+    Async variant of `services.transcribe_audio`. Segments of long recordings are transcribed concurrently
+    with the AsyncGroq client.
+    """
+    file_path = request.file_path
+    if not file_path or not os.path.exists(file_path):
+        raise InvalidRequestError("File not found.")
+
+    content_hash = request.content_hash or await asyncio.to_thread(get_content_hash, file_path)
+    text = transcript_cache.get(content_hash)
+    if text is not None:
+        return Transcription(text=text)
+
+    with timed("transcribe"):
+        duration = await asyncio.to_thread(get_audio_duration, file_path)
+        segments = plan_segments(duration, config.AUDIO_SEGMENT_SECONDS, config.AUDIO_SEGMENT_OVERLAP)
+        if len(segments) == 1:
+            text = await transcribe_segment(file_path)
+        else:
+            with tempfile.TemporaryDirectory() as segment_dir:
+                text = stitch_transcripts(await asyncio.gather(*(
+                    transcribe_segment(file_path, start, duration, segment_dir) for start, duration in segments
+                )))
+
+    transcript_cache.set(content_hash, text)
+    return Transcription(text=text)
+
+
+async def transcribe_segment(file_path, start=None, duration=None, segment_dir=None):
+    """
+    Async variant of `services.transcribe_segment`.
+    """
+    if start is not None:
+        file_path = await asyncio.to_thread(extract_segment, file_path, start, duration, segment_dir)
+
+    with timed("transcribe_segment"):
+        # The file is read on a worker thread, since the client would read it on the event loop
+        data = await asyncio.to_thread(read_file, file_path)
+        transcription = await get_async_groq_client().audio.transcriptions.create(
+            file=(os.path.basename(file_path), data),
+            model=TRANSCRIPTION_MODEL,
+            response_format="verbose_json",
+        )
+    return transcription.text
+
+
+def read_file(file_path):
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+async def flight_answer(query, flight, stream):
+    """
+    Turns an async generation flight into an `Answer`, streaming its tokens or waiting for the full response.
+    """
+    if not await flight.wait_found():
+        return Answer(query=query, found=False)
+    if stream:
+        return Answer(query=query, tokens=flight.subscribe())
+    return Answer(query=query, response=await flight.result())
+
+
+async def is_similar_query(query, other_query):
+    """
+    Async variant of `services.is_similar_query`.
+    """
+    embeddings = get_query_embeddings()
+    vector, other_vector = await asyncio.gather(embeddings.aembed_query(query), embeddings.aembed_query(other_query))
+    return is_similar_vector(vector, other_vector)
@@ -1,6 +1,5 @@
 from flask import Blueprint, request, jsonify # type: ignore
-from werkzeug.utils import secure_filename # type: ignore
-from groq import Groq   # type: ignore
+from api.services import TranscriptionRequest, InvalidRequestError, transcribe_audio
 import os
 
 audio_blueprint = Blueprint('audio_conversion', __name__)
@@ -14,21 +13,12 @@ def convert_audio_to_text():
     Converts uploaded audio file to text using Groq API.
     """
     data = request.get_json()
-    file_path = data.get("file")
-
-    if not file_path or not os.path.exists(file_path):
-        return jsonify({"error": "File not found."}), 400
 
     try:
-        # Use the Groq client for transcription
-        client = Groq()
-        with open(file_path, "rb") as file:
-            transcription = client.audio.transcriptions.create(
-                file=(file_path, file.read()),
-                model="whisper-large-v3",
-                response_format="verbose_json",
-            )
-        return jsonify({"transcription": transcription.get("text", "")}), 200
+        transcription = transcribe_audio(TranscriptionRequest(file_path=data.get("file")))
+        return jsonify({"transcription": transcription.text}), 200
 
+    except InvalidRequestError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,263 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from queue import Empty
+from threading import Condition, Lock
+import heapq
+import random
+import time
+from api.metrics import increment
+from config import config
+
+# Bulk upserts of embedded points into Qdrant that adapt to how fast Qdrant currently is.
+#
+#  - Batches are sized from the observed upsert latency, so every request takes about UPSERT_TARGET_SECONDS,
+#    and are capped at UPSERT_MAX_BATCH_BYTES of estimated payload.
+#  - Up to UPSERT_CONCURRENCY batches are in flight. When Qdrant slows down or fails, the window drops to one
+#    batch and the upserter stops taking points from the embed stage, which in turn pauses parsing.
+#  - Failed batches are split in half and retried after a jittered exponential backoff. Waiting for a retry
+#    holds no thread; the batch sits in a heap until it is due.
+#  - Every file is checkpointed as soon as all of its points are stored, so an interrupted ingest() only
+#    redoes the files that were not finished.
+
+
+def estimate_point_bytes(point):
+    """
+    Estimates the size of a point in an upsert request.
+    """
+    payload = point.payload or {}
+    return len(point.vector) * 12 + len(payload.get("page_content") or "") + 256
+
+
+class AdaptiveBatchSizer:
+    """
+    Chooses the number of points per upsert request from the latency of the previous requests.
+    """
+
+    def __init__(self, initial_size=None, min_size=16, max_size=None, target_seconds=None, max_bytes=None):
+        self.size = initial_size or config.UPSERT_BATCH_SIZE
+        self.min_size = min_size
+        self.max_size = max_size or config.UPSERT_MAX_BATCH_SIZE
+        self.target_seconds = target_seconds or config.UPSERT_TARGET_SECONDS
+        self.max_bytes = max_bytes or config.UPSERT_MAX_BATCH_BYTES
+
+    def take(self, points):
+        """
+        Removes the next batch from the deque `points`: at most `size` points and `max_bytes`, but at least one point.
+        """
+        batch, batch_bytes = [], 0
+        while points and len(batch) < self.size:
+            point_bytes = estimate_point_bytes(points[0])
+            if batch and batch_bytes + point_bytes > self.max_bytes:
+                break
+            batch.append(points.popleft())
+            batch_bytes += point_bytes
+        return batch
+
+    def record(self, batch_size, seconds):
+        """
+        Moves the batch size towards the size that would take `target_seconds` at the observed rate, at most
+        doubling it at a time.
+        """
+        ideal = self.target_seconds * batch_size / max(seconds, 1e-3)
+        size = min((self.size + ideal) / 2, self.size * 2)
+        self.size = int(max(self.min_size, min(self.max_size, size)))
+
+    def shrink(self):
+        self.size = max(self.min_size, self.size // 2)
+
+
+class IngestProgress:
+    """
+    Tracks the points every file still waits for. `on_file_complete(pdf_file_name, content_hash)` is called once
+    all points of a file were stored, which checkpoints it; files with failed points are never checkpointed and
+    are listed in the summary instead.
+    """
+
+    def __init__(self, on_file_complete):
+        self.on_file_complete = on_file_complete
+        self.upserted = 0
+        self.failed = 0
+        self.completed_files = 0
+        self.failed_files = {}  # pdf_file_name -> error message
+        self._files = {}  # pdf_file_name -> [points remaining, content hash]
+        self._lock = Lock()
+
+    def expect(self, pdf_file_name, point_count, content_hash):
+        """
+        Registers the number of points of a file that are about to enter the pipeline.
+        """
+        with self._lock:
+            self._files[pdf_file_name] = [point_count, content_hash]
+        if not point_count:
+            self._complete(pdf_file_name)
+
+    def file_failed(self, pdf_file_name, error):
+        with self._lock:
+            self.failed_files.setdefault(pdf_file_name, str(error))
+
+    def points_failed(self, pdf_file_names, error):
+        """
+        Records the failure of points, given by the file name of each point.
+        """
+        with self._lock:
+            self.failed += len(pdf_file_names)
+            for pdf_file_name in pdf_file_names:
+                self.failed_files.setdefault(pdf_file_name, str(error))
+
+    def points_stored(self, pdf_file_names):
+        """
+        Records stored points, given by the file name of each point, and checkpoints the files they complete.
+        """
+        completed = []
+        with self._lock:
+            self.upserted += len(pdf_file_names)
+            for pdf_file_name in pdf_file_names:
+                state = self._files.get(pdf_file_name)
+                if state is not None:
+                    state[0] -= 1
+                    if state[0] == 0:
+                        completed.append(pdf_file_name)
+        for pdf_file_name in completed:
+            self._complete(pdf_file_name)
+
+    def _complete(self, pdf_file_name):
+        with self._lock:
+            content_hash = self._files.pop(pdf_file_name)[1]
+            if pdf_file_name in self.failed_files:
+                return
+        try:
+            self.on_file_complete(pdf_file_name, content_hash)
+            with self._lock:
+                self.completed_files += 1
+        except Exception as e:
+            self.file_failed(pdf_file_name, f"checkpoint failed: {e}")
+
+    def summary(self):
+        with self._lock:
+            return {
+                "upserted": self.upserted,
+                "failed": self.failed,
+                "completed_files": self.completed_files,
+                "failed_files": dict(self.failed_files)
+            }
+
+
+class BulkUpserter:
+    """
+    Upserts the point batches of a queue with adaptive batch sizes, a bounded and adaptive number of requests
+    in flight and non-blocking retries.
+
+    Parameters:
+    upsert (callable): Writes one list of points, e.g. a partial of `upsert_points`.
+    progress (IngestProgress): Receives the stored and failed points.
+    """
+
+    def __init__(self, upsert, progress, sizer=None, concurrency=None, max_retries=None, retry_delay=None, max_retry_delay=None):
+        self.upsert = upsert
+        self.progress = progress
+        self.sizer = sizer or AdaptiveBatchSizer()
+        self.concurrency = concurrency or config.UPSERT_CONCURRENCY
+        self.max_retries = config.UPSERT_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_delay = retry_delay or config.UPSERT_RETRY_DELAY
+        self.max_retry_delay = max_retry_delay or config.UPSERT_RETRY_MAX_DELAY
+        self._window = self.concurrency  # Batches allowed in flight, halved when Qdrant is slow or failing
+        self._in_flight = 0
+        self._pending = deque()
+        self._retries = []  # Heap of (due time, sequence number, attempt, batch)
+        self._sequence = 0
+        self._condition = Condition()
+
+    def _backlog_limit(self):
+        # Stop taking points from the embed stage once enough are waiting to fill the current window twice
+        return self.sizer.size * self._window * 2
+
+    def run(self, point_queue):
+        """
+        Upserts every list of points put on `point_queue` until None is received and every batch was stored or
+        gave up. Runs on the upsert thread of the ingestion pipeline.
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="upsert") as pool:
+            input_done = False
+            while True:
+                with self._condition:
+                    self._dispatch(pool, flush=input_done)
+                    if input_done and not self._pending and not self._retries and not self._in_flight:
+                        return
+                    has_room = len(self._pending) < self._backlog_limit()
+                    if input_done or not has_room:
+                        self._condition.wait(self._next_wakeup())
+                        continue
+                try:
+                    points = point_queue.get(timeout=0.05)
+                except Empty:
+                    continue
+                if points is None:
+                    input_done = True
+                    continue
+                with self._condition:
+                    self._pending.extend(points)
+
+    def _next_wakeup(self):
+        if self._retries:
+            return max(self._retries[0][0] - time.monotonic(), 0.01)
+        return 0.5
+
+    def _dispatch(self, pool, flush):
+        # Called with the condition held. Due retries go first; a partial batch only leaves once no more
+        # points arrive soon, i.e. while the input is exhausted or the backlog is below one batch anyway.
+        now = time.monotonic()
+        while self._in_flight < self._window:
+            if self._retries and self._retries[0][0] <= now:
+                _, _, attempt, batch = heapq.heappop(self._retries)
+            elif self._pending and (flush or len(self._pending) >= self.sizer.size or self._in_flight == 0):
+                attempt, batch = 0, self.sizer.take(self._pending)
+            else:
+                return
+            self._in_flight += 1
+            pool.submit(self._upsert_batch, batch, attempt)
+
+    def _upsert_batch(self, batch, attempt):
+        start = time.perf_counter()
+        try:
+            self.upsert(batch)
+            error = None
+        except Exception as e:
+            error = e
+        seconds = time.perf_counter() - start
+
+        pdf_file_names = [(point.payload or {}).get("metadata", {}).get("pdf_file_name") for point in batch]
+        with self._condition:
+            self._in_flight -= 1
+            if error is None:
+                self.sizer.record(len(batch), seconds)
+                if seconds > self.sizer.target_seconds * 2:
+                    # Qdrant is slowing down: back off to one request at a time
+                    self._window = max(1, self._window // 2)
+                elif self._window < self.concurrency:
+                    self._window += 1
+            else:
+                self.sizer.shrink()
+                self._window = 1
+                if attempt < self.max_retries:
+                    self._schedule_retry(batch, attempt + 1)
+            self._condition.notify_all()
+
+        if error is None:
+            increment("upsert_points_total", len(batch), result="stored")
+            self.progress.points_stored(pdf_file_names)
+        elif attempt < self.max_retries:
+            increment("upsert_retries_total")
+            print(f"Upsert of {len(batch)} points failed, retrying (attempt {attempt + 1} of {self.max_retries}): {error}")
+        else:
+            increment("upsert_points_total", len(batch), result="failed")
+            print(f"Failed to upsert {len(batch)} points: {error}")
+            self.progress.points_failed(pdf_file_names, error)
+
+    def _schedule_retry(self, batch, attempt):
+        # Retry halves separately, so one oversized or rejected point does not sink the whole batch
+        halves = [batch[:len(batch) // 2], batch[len(batch) // 2:]] if len(batch) > 1 else [batch]
+        for half in halves:
+            # Full jitter keeps retries of concurrent batches from hitting Qdrant at the same moment
+            delay = random.uniform(0, min(self.max_retry_delay, self.retry_delay * 2 ** (attempt - 1)))
+            self._sequence += 1
+            heapq.heappush(self._retries, (time.monotonic() + delay, self._sequence, attempt, half))
@@ -0,0 +1,231 @@
+from collections import OrderedDict
+from uuid import uuid4
+import numpy as np # type: ignore
+import threading
+import asyncio
+import time
+import re
+from api.metrics import increment
+from api.resources import get_qdrant_client
+from config import config
+
+
+def normalize_query(query):
+    """
+    Normalizes a query so trivially different spellings share cache entries.
+    """
+    return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!. ")
+
+
+# Revision of the chatbot collection as last read by this process, and when it has to be read again
+_revision = {"value": None, "expiry": 0.0}
+_revision_lock = threading.Lock()
+
+# The only point of REVISION_COLLECTION_NAME, whose payload holds the revision
+REVISION_POINT_ID = 1
+
+
+def read_collection_revision():
+    """
+    Reads the revision of the chatbot collection from where the collection is stored, so every server sees the
+    revision bumped by ingest() wherever it runs: the version in the local index's CURRENT file, or the marker
+    point in Qdrant.
+    """
+    if config.VECTOR_BACKEND == "local":
+        from api.local_index import read_current_version
+        return read_current_version(config.LOCAL_INDEX_DIR) or ""
+
+    client = get_qdrant_client()
+    if not client.collection_exists(config.REVISION_COLLECTION_NAME):
+        return ""
+    points = client.retrieve(config.REVISION_COLLECTION_NAME, ids=[REVISION_POINT_ID], with_payload=True)
+    return points[0].payload["revision"] if points else ""
+
+
+def get_collection_revision():
+    """
+    Returns the revision of the chatbot collection written by the last ingest() that changed it. It is read
+    at most once per COLLECTION_REVISION_TTL seconds; if reading fails, the last revision read is kept.
+    """
+    with _revision_lock:
+        if _revision["expiry"] > time.monotonic():
+            return _revision["value"]
+        previous = _revision["value"]
+
+    try:
+        revision = read_collection_revision()
+    except Exception as e:
+        print(f"Failed to read the collection revision: {e}")
+        revision = previous or ""
+
+    with _revision_lock:
+        _revision.update(value=revision, expiry=time.monotonic() + config.COLLECTION_REVISION_TTL)
+    return revision
+
+
+async def aget_collection_revision():
+    """
+    Async variant of `get_collection_revision`. The revision is read on a worker thread when it has expired.
+    """
+    with _revision_lock:
+        if _revision["expiry"] > time.monotonic():
+            return _revision["value"]
+    return await asyncio.to_thread(get_collection_revision)
+
+
+def bump_collection_revision(client):
+    """
+    Marks the chatbot collection as changed, which invalidates the cached answers of every server once it reads
+    the new revision.
+
+    Parameters:
+    client: The Qdrant client ingest() wrote the collection with. The local index needs no marker, since every
+        LocalIndexWriter.commit() already writes a new version.
+    """
+    if config.VECTOR_BACKEND != "local":
+        from qdrant_client.http.models import Distance, VectorParams, PointStruct # type: ignore
+
+        if not client.collection_exists(config.REVISION_COLLECTION_NAME):
+            client.create_collection(config.REVISION_COLLECTION_NAME, vectors_config=VectorParams(size=1, distance=Distance.DOT))
+        client.upsert(config.REVISION_COLLECTION_NAME, points=[
+            PointStruct(id=REVISION_POINT_ID, vector=[1.0], payload={"revision": uuid4().hex})
+        ])
+    # This process sees its own change right away
+    with _revision_lock:
+        _revision["expiry"] = 0.0
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a per-entry time to live and hit/miss counters.
+    """
+
+    def __init__(self, name, max_size, ttl):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                increment("cache_requests_total", cache=self.name, result="miss")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            increment("cache_requests_total", cache=self.name, result="hit")
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+class SemanticAnswerCache:
+    """
+    Thread-safe cache of generated answers keyed by query embedding.
+
+    A lookup returns the stored answer of the most similar cached query, provided its cosine similarity
+    is at least `threshold`. Entries expire after `ttl` seconds, the least recently used entry is evicted
+    beyond `max_size`, and the whole cache is dropped when the collection revision changes.
+    """
+
+    def __init__(self, name, max_size, ttl, threshold):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # id -> (normalized vector, answer, expiry)
+        self._matrix = None
+        self._revision = None  # Read on first use, so importing the cache does not reach the vector backend
+        self._lock = threading.Lock()
+
+    def _check_revision(self):
+        revision = get_collection_revision()
+        if revision != self._revision:
+            if self._revision is not None:
+                self.invalidations += 1
+            self._entries.clear()
+            self._matrix = None
+            self._revision = revision
+
+    def get(self, vector):
+        with self._lock:
+            self._check_revision()
+            now = time.monotonic()
+            expired = [key for key, (_, _, expiry) in self._entries.items() if expiry < now]
+            for key in expired:
+                del self._entries[key]
+            if expired:
+                self._matrix = None
+
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix = np.stack([entry[0] for entry in self._entries.values()])
+                similarities = self._matrix @ _normalize(vector)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    key = list(self._entries)[best]
+                    self._entries.move_to_end(key)
+                    self._matrix = None
+                    self.hits += 1
+                    increment("cache_requests_total", cache=self.name, result="hit")
+                    return self._entries[key][1]
+
+            self.misses += 1
+            increment("cache_requests_total", cache=self.name, result="miss")
+            return None
+
+    def set(self, vector, answer, revision):
+        """
+        Stores `answer`, computed from the collection at `revision`. It is dropped if the collection changed since.
+        """
+        with self._lock:
+            self._check_revision()
+            if revision != self._revision:
+                return
+            self._entries[uuid4().hex] = (_normalize(vector), answer, time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self):
+        return {
+            "size": len(self._entries), "max_size": self.max_size, "hits": self.hits,
+            "misses": self.misses, "invalidations": self.invalidations
+        }
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+query_embedding_cache = TTLCache("query_embedding", config.QUERY_EMBEDDING_CACHE_SIZE, config.QUERY_EMBEDDING_CACHE_TTL)
+transcript_cache = TTLCache("transcript", config.TRANSCRIPT_CACHE_SIZE, config.TRANSCRIPT_CACHE_TTL)
+answer_cache = SemanticAnswerCache("answer", config.ANSWER_CACHE_SIZE, config.ANSWER_CACHE_TTL, config.ANSWER_CACHE_THRESHOLD)
@@ -1,15 +1,7 @@
 from flask import Blueprint, jsonify, request  # type: ignore
-import os
-from api.retrieval import retriever  # Assuming retriever is already set up for the chatbot collection
-from api.common import format_docs, run_chain, get_prompt_template
-from qdrant_client import QdrantClient  # type: ignore
-from langchain_qdrant import QdrantVectorStore  # type: ignore
-from qdrant_client.http.models import Distance, VectorParams  # type: ignore
-from langchain_community.embeddings import FastEmbedEmbeddings  # type: ignore
-from langchain_community.document_loaders import PyPDFLoader  # type: ignore
-from config import config
-from uuid import uuid4
-from langchain.docstore.document import Document  # type: ignore # Add this import
+from api.common import wants_stream, answer_response
+from api.services import ChatWithPdfRequest, InvalidRequestError, chat_with_pdf
+from api.upload_index import upload_index_cache
 
 # Blueprint for the chat routes
 chat_blueprint = Blueprint('chat_with_pdf', __name__)
@@ -25,120 +17,20 @@ def generate():
             return jsonify({"error": "Request must be JSON"}), 415
 
         data = request.get_json()
-        file_path = data.get("file")
-        query = data.get("query")
-        print(file_path)
-
-        # Validate inputs
-        if not query:
-            return jsonify({"error": "No query provided"}), 400
-
-        if file_path and not os.path.exists(file_path):
-            return jsonify({"error": "File not found or path invalid"}), 400
-
-        # Initialize Qdrant client
-        client = QdrantClient(url=config.QDRANT_URL, api_key=config.QDRANT_API_KEY, timeout=120)
-        embeddings = FastEmbedEmbeddings()
-
-        # Ensure the temporary collection exists
-        create_collection_if_not_exists(client)
-
-        # If a new file is uploaded, process and ingest its content
-        if file_path:
-            processed_data = process_file_data(file_path)
-            vector_store = QdrantVectorStore(
-                client=client,
-                collection_name=config.TEMP_COLLECTION_NAME,
-                embedding=embeddings
-            )
-            vector_store.add_documents(processed_data)
-            print(f"File {file_path} processed and data added to the collection.")
-
-        # Step 1: Query the PDF collection
-        vector_store = QdrantVectorStore(
-            client=client,
-            collection_name=config.TEMP_COLLECTION_NAME,
-            embedding=embeddings
-        )
-        collection_retriever = vector_store.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={"k": 3, "score_threshold": 0.5}
-        )
-        pdf_results = collection_retriever.get_relevant_documents(query)
-        pdf_context = format_docs(pdf_results)
-        print(pdf_context)
-
-        # Step 2: Use LLM to generate a refined query
-        inputs_for_refined_query = {"context": pdf_context, "question": query}
-        refined_query_template = get_prompt_template("refined_query")
-        refined_query = run_chain(refined_query_template, inputs_for_refined_query)
-        print(f"Refined query: {refined_query}")
-
-        # Step 3: Use the refined query to fetch information from the chatbot collection
-        chatbot_results = retriever.get_relevant_documents(refined_query)
-        chatbot_context = format_docs(chatbot_results)
-
-        # Step 4: Combine all contexts and generate the final response
-        combined_context = f"""
-            [PDF Collection Context]:
-            {pdf_context}
-
-            [Chatbot Collection Context]:
-            {chatbot_context}
-        """
-        final_inputs = {
-            "context": combined_context,
-            "question": query,
-            "refined_query": refined_query
-        }
-        final_prompt_template = get_prompt_template("chat_with_pdf")
-        final_answer = run_chain(final_prompt_template, final_inputs)
+        stream = wants_stream(data.get("stream"))
+        answer = chat_with_pdf(ChatWithPdfRequest(query=data.get("query"), file_path=data.get("file"), stream=stream))
 
         # Return the response
-        return jsonify({"response": final_answer}), 200
+        return answer_response(answer, stream)
 
+    except InvalidRequestError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-def create_collection_if_not_exists(client):
+@chat_blueprint.route('/cache_stats', methods=['GET'])
+def cache_stats():
     """
-    Creates the collection in Qdrant if it does not exist, or ensures its correct configuration.
+    Endpoint to report the size and hit/miss counters of the uploaded PDF index cache.
     """
-    try:
-        collections = client.get_collections().collections
-        if config.TEMP_COLLECTION_NAME not in [col.name for col in collections]:
-            client.create_collection(
-                collection_name=config.TEMP_COLLECTION_NAME,
-                vectors_config=VectorParams(size=384, distance=Distance.COSINE)
-            )
-            print(f"Collection {config.TEMP_COLLECTION_NAME} created successfully.")
-        else:
-            print(f"Collection {config.TEMP_COLLECTION_NAME} already exists.")
-    except Exception as e:
-        print(f"Failed to create collection: {e}")
-
-def process_file_data(file_path):
-    """
-    Process the uploaded PDF file and convert its content to documents for vectorization.
-
-    Args:
-        file_path (str): Path to the uploaded file.
-
-    Returns:
-        List[Document]: A list of Document objects with fields like `page_content` and `metadata`.
-    """
-    documents = []
-    try:
-        # Read the PDF file
-        docs = PyPDFLoader(file_path=file_path).load()
-        for i, doc in enumerate(docs):
-            if doc.page_content:  # Add only non-empty pages
-                documents.append(Document(
-                    page_content=doc.page_content.strip(),
-                    metadata={"source": file_path, "page": i + 1}
-                ))
-    except Exception as e:
-        raise ValueError(f"Error processing file: {e}")
-
-    return documents
-
+    return jsonify({"upload_index_cache": upload_index_cache.stats()})
@@ -1,11 +1,14 @@
-from langchain_groq import ChatGroq # type: ignore
-from langchain.prompts import PromptTemplate# type: ignore
-from langchain.schema.output_parser import StrOutputParser# type: ignore
-from langchain.schema.runnable import RunnablePassthrough # type: ignore
+from flask import Request, Response, jsonify, request # type: ignore
+from api.resources import get_chat_model
+from api.metrics import observe, observe_stage, increment
+from collections import deque
+from queue import Queue, Empty
 from config import config
-
-# Initialize Groq model with API key
-groq_chat = ChatGroq(groq_api_key=config.GROQ_API_KEY, model_name=config.MODEL_NAME)
+import threading
+import tempfile
+import hashlib
+import time
+import json
 
 def format_docs(docs):
     """
@@ -19,10 +22,21 @@ def format_docs(docs):
     """
     return "\n\n".join(doc.page_content for doc in docs)
 
+def get_model_name(use_case):
+    """
+    Returns the model a use case is routed to by MODEL_ROUTES: "large" (MODEL_NAME, the default), "fast"
+    (FAST_MODEL_NAME) or an explicit model name.
+    """
+    route = config.MODEL_ROUTES.get(use_case, "large")
+    return {"large": config.MODEL_NAME, "fast": config.FAST_MODEL_NAME}.get(route, route)
+
 def run_chain(prompt_template, inputs):
     """
     Runs the prompt chain with the given prompt template and inputs.
 
+    The model is chosen by the use case of the prompt template (see `get_model_name`), within the
+    LLM_LATENCY_BUDGET described in `route_chain`.
+
     Parameters:
     prompt_template (PromptTemplate): A prompt template object that defines the structure and content of the prompt.
     inputs (dict): A dictionary containing the inputs for the prompt template, such as context and question.
@@ -30,13 +44,412 @@ def run_chain(prompt_template, inputs):
     Returns:
     str: The output generated by the prompt chain, parsed as a string.
     """
-    chain = RunnablePassthrough() | prompt_template | groq_chat | StrOutputParser()
-    return chain.invoke(inputs)
+    return "".join(route_chain(prompt_template, inputs, stream=False))
+
+def stream_chain(prompt_template, inputs):
+    """
+    Streaming variant of `run_chain`. The latency budget applies to the first token.
+
+    Returns:
+    Iterator[str]: The output of the prompt chain, yielded token by token as the model generates it.
+    """
+    return route_chain(prompt_template, inputs, stream=True)
+
+def route_chain(prompt_template, inputs, stream):
+    """
+    Yields the output of the model the use case is routed to.
+
+    If that model has not answered (or, when streaming, produced its first token) within LLM_LATENCY_BUDGET
+    seconds, the request is hedged: FAST_MODEL_NAME is started as well, and whichever model responds first
+    answers. If the routed model fails before responding, the fast model answers instead. The losing call
+    stops generating at its next token.
+    """
+
+    use_case = get_use_case(prompt_template)
+    model_name = get_model_name(use_case)
+    hedge_model_name = config.FAST_MODEL_NAME if config.LLM_LATENCY_BUDGET and model_name != config.FAST_MODEL_NAME else None
+    deadline = time.monotonic() + config.LLM_LATENCY_BUDGET
+    events = Queue()  # (model name, "token" | "done" | "error", payload) from every started call
+    cancelled = {}
+
+    def start(name):
+        cancelled[name] = threading.Event()
+        start_chain(prompt_template, inputs, use_case, name, stream, events, cancelled[name])
+
+    start(model_name)
+    running = {model_name}
+    result = "primary"
+    try:
+        while True:
+            hedge_pending = hedge_model_name is not None and hedge_model_name not in cancelled
+            try:
+                name, kind, payload = events.get(timeout=max(deadline - time.monotonic(), 0) if hedge_pending else None)
+            except Empty:
+                increment("llm_hedges_total", use_case=use_case, model=hedge_model_name)
+                start(hedge_model_name)
+                running.add(hedge_model_name)
+                result = "hedge"
+                continue
+            if kind == "error":
+                running.discard(name)
+                if hedge_model_name is not None and hedge_model_name not in cancelled:
+                    print(f"Model {name} failed for {use_case}, falling back to {hedge_model_name}: {payload}")
+                    start(hedge_model_name)
+                    running.add(hedge_model_name)
+                    result = "fallback"
+                    continue
+                if not running:
+                    increment("llm_route_total", use_case=use_case, model=name, result="error")
+                    raise payload
+                continue
+            break
+
+        winner = name
+        increment("llm_route_total", use_case=use_case, model=winner, result=result if winner != model_name else "primary")
+        for other in cancelled:
+            if other != winner:
+                cancelled[other].set()
+        while kind != "done":
+            if kind == "error":
+                raise payload
+            if name == winner:
+                yield payload
+            name, kind, payload = events.get()
+            while name != winner:
+                name, kind, payload = events.get()
+    finally:
+        # Stops the calls when the consumer goes away, e.g. a client disconnecting from the stream
+        for event in cancelled.values():
+            event.set()
+
+def start_chain(prompt_template, inputs, use_case, model_name, stream, events, cancelled):
+    """
+    Runs the prompt chain on `model_name` on a background thread, putting its tokens on `events`.
+    """
+    from threading import Thread
+    from contextvars import copy_context
+    from langchain.schema.runnable import RunnablePassthrough # type: ignore
+
+    def call():
+        chain = RunnablePassthrough() | prompt_template | get_chat_model(model_name)
+        start = time.perf_counter()
+        # The model is streamed even when only the full response is wanted, so an abandoned call closes its
+        # stream at the next chunk instead of generating (and spending tokens and rate limit) to the end
+        chunks = chain.stream(inputs)
+        try:
+            parts = []
+            for chunk in chunks:
+                if cancelled.is_set():
+                    increment("llm_abandoned_calls_total", use_case=use_case, model=model_name)
+                    return
+                if stream and not parts:
+                    observe("llm_time_to_first_token_seconds", time.perf_counter() - start, use_case=use_case, model=model_name)
+                record_token_usage(use_case, model_name, chunk.usage_metadata)
+                parts.append(chunk.content)
+                if stream:
+                    events.put((model_name, "token", chunk.content))
+            if not stream:
+                events.put((model_name, "token", "".join(parts)))
+            seconds = time.perf_counter() - start
+            observe_stage("llm", seconds, use_case=use_case, model=model_name)
+            model_stats.record(model_name, seconds)
+            events.put((model_name, "done", None))
+        except Exception as e:
+            model_stats.record(model_name, time.perf_counter() - start, error=True)
+            events.put((model_name, "error", e))
+        finally:
+            chunks.close()
+
+    Thread(target=copy_context().run, args=(call,), name=f"llm-{model_name}", daemon=True).start()
+
+async def arun_chain(prompt_template, inputs):
+    """
+    Async variant of `run_chain` for the async serving mode, built on the chain's `ainvoke`.
+    """
+    return "".join([token async for token in aroute_chain(prompt_template, inputs, stream=False)])
+
+def astream_chain(prompt_template, inputs):
+    """
+    Async variant of `stream_chain`, built on the chain's `astream`.
+
+    Returns:
+    AsyncIterator[str]: The output of the prompt chain, token by token.
+    """
+    return aroute_chain(prompt_template, inputs, stream=True)
+
+async def aroute_chain(prompt_template, inputs, stream):
+    """
+    Async variant of `route_chain`, with the same routing, hedging and fallback. Every call runs as a task on the
+    event loop instead of a thread, and the losing call is cancelled.
+    """
+    import asyncio
+
+    use_case = get_use_case(prompt_template)
+    model_name = get_model_name(use_case)
+    hedge_model_name = config.FAST_MODEL_NAME if config.LLM_LATENCY_BUDGET and model_name != config.FAST_MODEL_NAME else None
+    deadline = time.monotonic() + config.LLM_LATENCY_BUDGET
+    events = asyncio.Queue()  # (model name, "token" | "done" | "error", payload) from every started call
+    tasks = {}
+
+    def start(name):
+        tasks[name] = asyncio.create_task(astart_chain(prompt_template, inputs, use_case, name, stream, events))
+
+    start(model_name)
+    running = {model_name}
+    result = "primary"
+    try:
+        while True:
+            hedge_pending = hedge_model_name is not None and hedge_model_name not in tasks
+            try:
+                name, kind, payload = await asyncio.wait_for(
+                    events.get(), timeout=max(deadline - time.monotonic(), 0) if hedge_pending else None
+                )
+            except asyncio.TimeoutError:
+                increment("llm_hedges_total", use_case=use_case, model=hedge_model_name)
+                start(hedge_model_name)
+                running.add(hedge_model_name)
+                result = "hedge"
+                continue
+            if kind == "error":
+                running.discard(name)
+                if hedge_model_name is not None and hedge_model_name not in tasks:
+                    print(f"Model {name} failed for {use_case}, falling back to {hedge_model_name}: {payload}")
+                    start(hedge_model_name)
+                    running.add(hedge_model_name)
+                    result = "fallback"
+                    continue
+                if not running:
+                    increment("llm_route_total", use_case=use_case, model=name, result="error")
+                    raise payload
+                continue
+            break
+
+        winner = name
+        increment("llm_route_total", use_case=use_case, model=winner, result=result if winner != model_name else "primary")
+        for other, task in tasks.items():
+            if other != winner:
+                task.cancel()
+        while kind != "done":
+            if kind == "error":
+                raise payload
+            if name == winner:
+                yield payload
+            name, kind, payload = await events.get()
+            while name != winner:
+                name, kind, payload = await events.get()
+    finally:
+        # Stops the calls when the consumer goes away, e.g. a client disconnecting from the stream
+        for task in tasks.values():
+            task.cancel()
+
+async def astart_chain(prompt_template, inputs, use_case, model_name, stream, events):
+    """
+    Runs the prompt chain on `model_name` with the async LangChain API, putting its tokens on `events`.
+    """
+    import asyncio
+    from langchain.schema.output_parser import StrOutputParser # type: ignore
+    from langchain.schema.runnable import RunnablePassthrough # type: ignore
+
+    chain = RunnablePassthrough() | prompt_template | get_chat_model(model_name)
+    start = time.perf_counter()
+    try:
+        if stream:
+            first_token = True
+            async for chunk in chain.astream(inputs):
+                if first_token:
+                    observe("llm_time_to_first_token_seconds", time.perf_counter() - start, use_case=use_case, model=model_name)
+                    first_token = False
+                record_token_usage(use_case, model_name, chunk.usage_metadata)
+                events.put_nowait((model_name, "token", chunk.content))
+        else:
+            message = await chain.ainvoke(inputs)
+            record_token_usage(use_case, model_name, message.usage_metadata)
+            events.put_nowait((model_name, "token", StrOutputParser().invoke(message)))
+        seconds = time.perf_counter() - start
+        observe_stage("llm", seconds, use_case=use_case, model=model_name)
+        model_stats.record(model_name, seconds)
+        events.put_nowait((model_name, "done", None))
+    except asyncio.CancelledError:
+        increment("llm_abandoned_calls_total", use_case=use_case, model=model_name)
+        raise
+    except Exception as e:
+        model_stats.record(model_name, time.perf_counter() - start, error=True)
+        events.put_nowait((model_name, "error", e))
+
+def get_use_case(prompt_template):
+    """
+    Returns the use case a prompt template was created for by `get_prompt_template`.
+    """
+    return (prompt_template.metadata or {}).get("use_case", "unknown")
+
+def record_token_usage(use_case, model_name, usage_metadata):
+    """
+    Counts the prompt and completion tokens reported by the model.
+    """
+    if usage_metadata:
+        increment("llm_tokens_total", usage_metadata.get("input_tokens", 0), use_case=use_case, model=model_name, type="prompt")
+        increment("llm_tokens_total", usage_metadata.get("output_tokens", 0), use_case=use_case, model=model_name, type="completion")
+        model_stats.record_tokens(model_name, usage_metadata.get("input_tokens", 0), usage_metadata.get("output_tokens", 0))
+
+class ModelStats:
+    """
+    Thread-safe per-model call counts, recent latencies and token totals, for tuning the model routing.
+    """
+
+    def __init__(self, window=500):
+        self.window = window
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model(self, model_name):
+        return self._models.setdefault(model_name, {
+            "calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "latencies": deque(maxlen=self.window)
+        })
+
+    def record(self, model_name, seconds, error=False):
+        """
+        Records a finished or failed call. Calls abandoned by the hedging in `route_chain` are not recorded,
+        since they were cut short.
+        """
+        with self._lock:
+            model = self._model(model_name)
+            model["calls"] += 1
+            model["errors"] += error
+            if not error:
+                model["latencies"].append(seconds)
+
+    def record_tokens(self, model_name, prompt_tokens, completion_tokens):
+        with self._lock:
+            model = self._model(model_name)
+            model["prompt_tokens"] += prompt_tokens
+            model["completion_tokens"] += completion_tokens
+
+    def stats(self):
+        with self._lock:
+            stats = {}
+            for model_name, model in self._models.items():
+                latencies = sorted(model["latencies"])
+                stats[model_name] = {
+                    **{key: value for key, value in model.items() if key != "latencies"},
+                    "p50_seconds": latencies[len(latencies) // 2] if latencies else None,
+                    "p95_seconds": latencies[int(len(latencies) * 0.95)] if latencies else None,
+                }
+            return stats
+
+model_stats = ModelStats()
+
+def wants_stream(flag=None):
+    """
+    Checks whether the client asked for a streamed response, either with a truthy `stream` field
+    or with an `Accept: text/event-stream` header.
+    """
+    if isinstance(flag, str):
+        flag = flag.lower() in ['true', '1', 't']
+    return bool(flag) or request.accept_mimetypes.best == "text/event-stream"
+
+def sse_event(data, event=None):
+    """
+    Formats `data` as a single Server-Sent Event.
+    """
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+def sse_response(tokens, on_complete=None, **fields):
+    """
+    Streams tokens to the client as Server-Sent Events.
+
+    Every token is sent as a `{"token": ...}` event. Once the stream is exhausted, a `done` event carries the
+    full response together with `fields`, and `on_complete` is called with the full response. Failures
+    mid-stream are reported as an `error` event, since the status code has already been sent.
+
+    Parameters:
+    tokens (Iterable[str]): The tokens to stream, e.g. the output of `stream_chain`.
+    on_complete (callable): Optional callback receiving the full response.
+
+    Returns:
+    Response: A `text/event-stream` response.
+    """
+    def generate():
+        parts = []
+        try:
+            for token in tokens:
+                parts.append(token)
+                yield sse_event({"token": token})
+            response = "".join(parts)
+            if on_complete:
+                on_complete(response)
+            yield sse_event({**fields, "response": response}, event="done")
+        except Exception as e:
+            yield sse_event({"error": str(e)}, event="error")
+
+    return Response(generate(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def answer_response(answer, stream, **fields):
+    """
+    Renders an `Answer` from the service layer as a JSON response, or as Server-Sent Events if `stream` is set.
+    """
+    if answer.tokens is not None or stream:
+        tokens = answer.tokens if answer.tokens is not None else [answer.response]
+        return sse_response(tokens, on_complete=answer.on_complete, **fields)
+    return jsonify({**fields, "response": answer.response})
+
+class HashingSpooledFile(tempfile.SpooledTemporaryFile):
+    """
+    Buffer of an uploaded file that hashes the contents as they are written. It stays in memory up to
+    UPLOAD_SPOOL_MAX_BYTES and is moved to an anonymous temporary file beyond that. Nothing is left on disk once
+    it is closed, and concurrent uploads with the same filename never share a buffer.
+    """
+
+    def __init__(self, max_size=None):
+        super().__init__(max_size=config.UPLOAD_SPOOL_MAX_BYTES if max_size is None else max_size)
+        self._sha256 = hashlib.sha256()
+        self._holders = 1
+        self._holders_lock = threading.Lock()
+
+    def retain(self):
+        """
+        Keeps the buffer open until `close` is called once more, for a reader that may outlive the request, such
+        as a single-flight computation.
+        """
+        with self._holders_lock:
+            self._holders += 1
+        return self
+
+    def close(self):
+        with self._holders_lock:
+            self._holders -= 1
+            if self._holders > 0:
+                return
+        super().close()
+
+    def write(self, data):
+        self._sha256.update(data)
+        return super().write(data)
+
+    @property
+    def content_hash(self):
+        """
+        The SHA-256 hash of everything written so far.
+        """
+        return self._sha256.hexdigest()
+
+class UploadRequest(Request):
+    """
+    Request class that receives uploaded files into `HashingSpooledFile` buffers, so the files are hashed while
+    the request body is parsed and only touch the disk above UPLOAD_SPOOL_MAX_BYTES.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpooledFile()
 
 # Define prompt templates
 def get_prompt_template(use_case):
+    from langchain.prompts import PromptTemplate # type: ignore
+
     if use_case == "generation":
         return PromptTemplate(
+            metadata={"use_case": use_case},
             input_variables=["context", "question"],
             template="""
             <s> [INST] You are an expert assistant providing detailed information specifically about Vishwakarma Institute of Technology (VIT), Pune. 
@@ -63,6 +476,7 @@ def get_prompt_template(use_case):
     
     if use_case == "refined_query":
         return PromptTemplate(
+            metadata={"use_case": use_case},
             input_variables=["context", "question"],
             template="""
             <s> [INST] You are tasked with generating a refined and precise query based on the provided context and user question.
@@ -80,6 +494,7 @@ def get_prompt_template(use_case):
     
     if use_case == "chat_with_pdf":
         return PromptTemplate(
+            metadata={"use_case": use_case},
             input_variables=["context", "question", "refined_query"],
             template="""
             <s> [INST] You are an expert assistant specialized in providing detailed and accurate information about Vishwakarma Institute of Technology (VIT), Pune. Users may upload their marks documents containing Merit Rank and CET Percentile Scores. You will assist them with queries related to admissions based on their scores. Please adhere to the following guidelines:
@@ -105,6 +520,7 @@ def get_prompt_template(use_case):
     )
     if use_case == "refine_query":
         return PromptTemplate(
+            metadata={"use_case": use_case},
             input_variables=["question"],
             template="""
             <s> [INST] You are an expert assistant tasked with refining user queries to make them specific, clear, and actionable. Your role is to interpret the intent behind the query and rewrite it to be focused, detailed, and easy to process. The queries can be related to admissions, facilities, events, departments, or any general information about Vishwakarma Institute of Technology (VIT), Pune. Please adhere to the following guidelines:
@@ -0,0 +1,135 @@
+from dataclasses import dataclass
+import re
+from api.metrics import increment
+from config import config
+
+# Packs retrieved documents into a prompt context that fits a token budget. The chunks of the chatbot collection
+# overlap their neighbours by up to 200 characters and often repeat each other, so joining them as they are
+# wastes prompt tokens on every call.
+
+MIN_OVERLAP = 20  # Shortest shared text treated as splitter overlap rather than a coincidence
+MAX_OVERLAP = 400
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens_before: int  # Estimated tokens of the documents joined as they are
+    tokens_after: int
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_before - self.tokens_after
+
+
+def count_tokens(text):
+    """
+    Estimates the number of LLM tokens of `text`, at about four characters per token for English text.
+    """
+    return (len(text) + 3) // 4
+
+
+def _overlap(first, second):
+    """
+    Returns the length of the longest end of `first` that `second` starts with, if long enough to be splitter overlap.
+    """
+    head = second[:MIN_OVERLAP]
+    if len(head) < MIN_OVERLAP:
+        return 0
+    # Candidate overlaps start where the beginning of `second` occurs near the end of `first`, longest first
+    index = first.find(head, max(len(first) - min(len(second), MAX_OVERLAP), 0))
+    while index != -1:
+        if second.startswith(first[index:]):
+            return len(first) - index
+        index = first.find(head, index + 1)
+    return 0
+
+
+def _merge(first, second):
+    """
+    Joins two passages of the same file if one continues the other, or returns None.
+    """
+    overlap = _overlap(first, second)
+    if overlap:
+        return first + second[overlap:]
+    overlap = _overlap(second, first)
+    if overlap:
+        return second + first[overlap:]
+    return None
+
+
+def _shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+
+def _is_near_duplicate(shingles, other_shingles, threshold):
+    if not shingles or not other_shingles:
+        return False
+    common = len(shingles & other_shingles)
+    # Near-identical passages, or a passage contained in another one
+    return common / len(shingles | other_shingles) >= threshold or common / len(shingles) >= threshold
+
+
+def pack_context(docs, token_budget=None, dedup_threshold=None, use_case="unknown"):
+    """
+    Packs documents, best first, into a context of at most `token_budget` estimated tokens.
+
+    Adjacent chunks of the same `pdf_file_name` are merged with their overlap removed, passages that
+    near-duplicate a better-scoring one are dropped, and the remaining passages are added in score order
+    while they fit the budget.
+
+    Parameters:
+    docs (list): The retrieved documents, best first.
+    token_budget (int): Defaults to CONTEXT_TOKEN_BUDGET.
+    dedup_threshold (float): Shingle similarity above which a passage is dropped. Defaults to CONTEXT_DEDUP_THRESHOLD.
+
+    Returns:
+    PackedContext: The context and its estimated token counts before and after packing.
+    """
+    token_budget = token_budget or config.CONTEXT_TOKEN_BUDGET
+    dedup_threshold = dedup_threshold or config.CONTEXT_DEDUP_THRESHOLD
+
+    # Merge chunks into passages; a merged passage keeps the rank of its best chunk
+    passages = []  # (rank, source, text)
+    for rank, doc in enumerate(docs):
+        source = doc.metadata.get("pdf_file_name") or doc.metadata.get("source")
+        text = doc.page_content.strip()
+        merging = True
+        while merging:
+            merging = False
+            for passage in passages:
+                merged = passage[1] == source and _merge(passage[2], text)
+                if merged:
+                    # The merged passage may now also continue another one, so look again
+                    passages.remove(passage)
+                    rank, text, merging = min(rank, passage[0]), merged, True
+                    break
+        passages.append((rank, source, text))
+    passages.sort(key=lambda passage: passage[0])
+
+    # Drop near-duplicates and fill the budget in score order
+    kept, kept_shingles, tokens = [], [], 0
+    for _, _, text in passages:
+        shingles = _shingles(text)
+        if any(_is_near_duplicate(shingles, other, dedup_threshold) for other in kept_shingles):
+            continue
+        passage_tokens = count_tokens(text)
+        if tokens + passage_tokens > token_budget:
+            if kept:
+                continue
+            # Keep at least the beginning of the best passage
+            text = text[:token_budget * 4]
+            passage_tokens = count_tokens(text)
+        kept.append(text)
+        kept_shingles.append(shingles)
+        tokens += passage_tokens
+
+    packed = PackedContext(
+        text="\n\n".join(kept),
+        tokens_before=count_tokens("\n\n".join(doc.page_content for doc in docs)),
+        tokens_after=count_tokens("\n\n".join(kept))
+    )
+    increment("context_tokens_total", packed.tokens_before, use_case=use_case, type="retrieved")
+    increment("context_tokens_total", packed.tokens_after, use_case=use_case, type="packed")
+    return packed
@@ -0,0 +1,55 @@
+import numpy as np # type: ignore
+import threading
+import sqlite3
+import os
+
+# On-disk cache of chunk embeddings keyed by the deterministic chunk ID computed at ingestion, so chunks that were
+# embedded before are never embedded again, even after the collection is rebuilt. Vectors are stored as float32
+# blobs in a single SQLite file, per embedding model.
+
+
+class EmbeddingCache:
+    """
+    Thread-safe SQLite-backed map from chunk IDs to embeddings of one embedding model.
+    """
+
+    def __init__(self, path, model_name):
+        self.model_name = model_name
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (model TEXT, chunk_id TEXT, vector BLOB, PRIMARY KEY (model, chunk_id))"
+        )
+        self._lock = threading.Lock()
+
+    def get_many(self, chunk_ids):
+        """
+        Returns a dict mapping the cached chunk IDs among `chunk_ids` to their embeddings.
+        """
+        vectors = {}
+        with self._lock:
+            # Stay below SQLite's limit on the number of query parameters
+            for i in range(0, len(chunk_ids), 500):
+                batch = chunk_ids[i:i + 500]
+                rows = self._connection.execute(
+                    f"SELECT chunk_id, vector FROM embeddings WHERE model = ? AND chunk_id IN ({','.join('?' * len(batch))})",
+                    [self.model_name, *batch]
+                )
+                for chunk_id, vector in rows:
+                    vectors[chunk_id] = np.frombuffer(vector, dtype=np.float32).tolist()
+        return vectors
+
+    def set_many(self, vectors):
+        """
+        Stores the embeddings of a dict mapping chunk IDs to vectors.
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [(self.model_name, chunk_id, np.asarray(vector, dtype=np.float32).tobytes()) for chunk_id, vector in vectors.items()]
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
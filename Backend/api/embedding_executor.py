@@ -0,0 +1,140 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+from threading import Condition, Semaphore, Thread
+import time
+from api.metrics import increment, timed
+
+# Micro-batching in front of the embedding model. Concurrent requests each embedding one query would otherwise
+# run many tiny ONNX calls that compete for the same cores; instead, requests arriving within a few milliseconds
+# of each other are embedded together in one call, on a dedicated thread pool of a fixed size.
+#
+# Query texts take precedence over document texts, so background ingestion never delays request traffic by more
+# than the batch already running.
+
+
+class _Request:
+    """
+    One submitted call, whose texts may be spread over several batches.
+    """
+
+    def __init__(self, texts, single):
+        self.future = Future()
+        self.vectors = [None] * len(texts)
+        self.remaining = len(texts)
+        self.single = single
+
+    def set_vector(self, index, vector):
+        self.vectors[index] = vector
+        self.remaining -= 1
+        if not self.remaining and not self.future.done():
+            self.future.set_result(self.vectors[0] if self.single else self.vectors)
+
+    def set_exception(self, error):
+        if not self.future.done():
+            self.future.set_exception(error)
+
+
+class EmbeddingExecutor:
+    """
+    Collects the texts submitted by concurrent callers for up to `max_wait` seconds, or until `max_batch_size`
+    texts are waiting, and embeds them as one batch. Callers get a Future for every submitted call.
+
+    At most `workers` batches run at the same time, so the ONNX threads of the model (EMBEDDING_THREADS) are
+    the only parallelism spent on embedding in the process.
+    """
+
+    def __init__(self, embeddings, max_batch_size=128, max_wait=0.005, workers=1):
+        self.embeddings = embeddings
+        self.model_name = getattr(embeddings, "model_name", None) or type(embeddings).__name__
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.workers = workers
+        self._queues = {"query": deque(), "document": deque()}  # (request, index, text), in priority order
+        self._condition = Condition()
+        self._slots = Semaphore(workers)
+        self._pool = None
+        self._collector = None
+
+    def _start(self):
+        # Threads are started on first use rather than in __init__, so an executor built before gunicorn forks
+        # its workers does not lose them
+        if self._collector is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed")
+            self._collector = Thread(target=self._collect, name="embed-collector", daemon=True)
+            self._collector.start()
+
+    def _submit(self, kind, texts, single=False):
+        request = _Request(texts, single)
+        if not texts:
+            request.future.set_result([])
+            return request.future
+        with self._condition:
+            self._start()
+            self._queues[kind].extend((request, i, text) for i, text in enumerate(texts))
+            self._condition.notify()
+        return request.future
+
+    def submit_query(self, text):
+        """
+        Schedules the embedding of a search query. Returns a Future of its vector.
+        """
+        return self._submit("query", [text], single=True)
+
+    def submit_queries(self, texts):
+        """
+        Schedules the embedding of several search queries. Returns a Future of their vectors, in order.
+        """
+        return self._submit("query", list(texts))
+
+    def submit_documents(self, texts):
+        """
+        Schedules the embedding of documents. Returns a Future of their vectors, in order. Long lists are
+        split over several batches, so queries submitted meanwhile are not held up by them.
+        """
+        return self._submit("document", list(texts))
+
+    def embed_query(self, text):
+        return self.submit_query(text).result()
+
+    def embed_documents(self, texts):
+        return self.submit_documents(texts).result()
+
+    def _pending(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _collect(self):
+        while True:
+            # Only form a batch once it can run right away; texts arriving meanwhile join it
+            self._slots.acquire()
+            with self._condition:
+                self._condition.wait_for(self._pending)
+                deadline = time.monotonic() + self.max_wait
+                while self._pending() < self.max_batch_size and (remaining := deadline - time.monotonic()) > 0:
+                    self._condition.wait(remaining)
+                # A batch holds texts of one kind, since queries and documents are embedded by different calls
+                kind = "query" if self._queues["query"] else "document"
+                queue = self._queues[kind]
+                batch = [queue.popleft() for _ in range(min(len(queue), self.max_batch_size))]
+            self._pool.submit(self._run_batch, kind, batch)
+
+    def _run_batch(self, kind, batch):
+        try:
+            texts = [text for _, _, text in batch]
+            with timed("embed_batch", kind=kind):
+                vectors = self._embed_queries(texts) if kind == "query" else self.embeddings.embed_documents(texts)
+            increment("embedding_batches_total", kind=kind)
+            increment("embedding_batch_items_total", len(batch), kind=kind)
+            for (request, index, _), vector in zip(batch, vectors):
+                request.set_vector(index, vector)
+        except Exception as e:
+            for request, _, _ in batch:
+                request.set_exception(e)
+        finally:
+            self._slots.release()
+
+    def _embed_queries(self, texts):
+        # FastEmbed embeds query lists in one pass; other models fall back to one call per query
+        model = getattr(self.embeddings, "_model", None)
+        if hasattr(model, "query_embed"):
+            return [vector.tolist() for vector in model.query_embed(texts)]
+        return [self.embeddings.embed_query(text) for text in texts]
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request # type: ignore
-from api.common import format_docs, run_chain, get_prompt_template
-from api.retrieval import retriever
+from api.common import wants_stream, answer_response, model_stats
+from api.services import GenerationRequest, generate_answer
+from api.cache import answer_cache, query_embedding_cache
 
 
 generation_blueprint = Blueprint('generation', __name__)
@@ -16,23 +17,30 @@ def generate():
 
         data = request.get_json()
         query = data.get("query", "What is the purpose of this document?")
-        
-        # inputs = {"question": query}
-        # prompt_template = get_prompt_template("refine_query")
-        # query = run_chain(prompt_template, inputs)
-        # print(query)
-
-        results = retriever.get_relevant_documents(query)
-        context = format_docs(results)
-        
-        if not context:
+        stream = wants_stream(data.get("stream"))
+        answer = generate_answer(GenerationRequest(query=query, stream=stream))
+
+        if not answer.found:
             return jsonify({"answer": "I don't know the answer."})
 
-        inputs = {"context": context, "question": query}
-        prompt_template = get_prompt_template("generation")
-        answer = run_chain(prompt_template, inputs)
-        
-        return jsonify({"query": query, "response": answer})
+        return answer_response(answer, stream, query=query)
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+@generation_blueprint.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """
+    Endpoint to report the size and hit/miss counters of the query caches.
+    """
+    return jsonify({
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "answer_cache": answer_cache.stats()
+    })
+
+@generation_blueprint.route('/model_stats', methods=['GET'])
+def get_model_stats():
+    """
+    Endpoint to report the calls, recent latencies and token counts of every LLM, for tuning the model routing.
+    """
+    return jsonify(model_stats.stats())
@@ -1,165 +1,573 @@
-from qdrant_client import QdrantClient # type: ignore
-from qdrant_client.http.models import Distance, VectorParams # type: ignore
+from qdrant_client.http.models import Distance, VectorParams, PayloadSchemaType, FilterSelector, Filter, FieldCondition, MatchValue, PointStruct, PointIdsList, CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation # type: ignore
 from langchain_qdrant import QdrantVectorStore # type: ignore
-from langchain_community.document_loaders import PyPDFLoader # type: ignore
 from langchain.text_splitter import RecursiveCharacterTextSplitter # type: ignore
-from langchain_community.embeddings import FastEmbedEmbeddings # type: ignore
 import os
 from config import config
-from concurrent.futures import ThreadPoolExecutor
+from api.resources import get_qdrant_client, get_embedding_executor
+from api.cache import bump_collection_revision
+from api.local_index import LocalIndexWriter
+from api.metrics import timed, observe_stage
+from api.page_store import page_store, get_pdf_content_hash
+from api.embedding_cache import EmbeddingCache
+from api.bulk_upsert import BulkUpserter, IngestProgress
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from queue import Queue
+from threading import Thread
+from uuid import UUID, uuid4
+import multiprocessing
 import time
-from functools import wraps
+import hashlib
+from functools import partial
+from contextlib import nullcontext
+
+# Payload keys written by QdrantVectorStore nest chunk metadata under "metadata"
+PDF_FILE_NAME_KEY = "metadata.pdf_file_name"
+CONTENT_HASH_KEY = "metadata.content_hash"
+
+def create_collection(client, collection_name):
+    """
+    Creates a collection with the correct dimensionality and the payload indexes used by the sync pass.
+    """
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=VectorParams(size=384, distance=Distance.COSINE)
+    )
+    print(f"Collection {collection_name} created successfully.")
+    create_payload_indexes(client, collection_name)
+
+
+def create_payload_indexes(client, collection_name):
+    """
+    Makes sure the payload fields used by the sync pass are indexed.
+    """
+    payload_schema = client.get_collection(collection_name).payload_schema or {}
+    for field_name in (PDF_FILE_NAME_KEY, CONTENT_HASH_KEY):
+        if field_name not in payload_schema:
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=PayloadSchemaType.KEYWORD
+            )
+            print(f"Payload index created for {field_name}.")
+
 
 def create_collection_if_not_exists(client):
     """
-    Creates the collection in Qdrant if it does not exist, or recreates it with the correct dimensionality.
+    Makes sure COLLECTION_NAME can be served from. A new deployment gets a versioned collection behind the
+    COLLECTION_NAME alias, so later full rebuilds can replace it without downtime.
     """
     try:
-        collections = client.get_collections().collections
-        if config.COLLECTION_NAME not in [col.name for col in collections]:
-            client.create_collection(
-                collection_name=config.COLLECTION_NAME,
-                vectors_config=VectorParams(size=384, distance=Distance.COSINE)
-            )
-            print(f"Collection {config.COLLECTION_NAME} created successfully.")
-        else:
+        if client.collection_exists(config.COLLECTION_NAME):
             print(f"Collection {config.COLLECTION_NAME} already exists.")
+            create_payload_indexes(client, get_alias_target(client) or config.COLLECTION_NAME)
+        else:
+            collection_name = new_collection_name()
+            create_collection(client, collection_name)
+            switch_alias(client, collection_name)
     except Exception as e:
         print(f"Failed to create collection: {e}")
 
-def retry(exceptions, tries=3, delay=2, backoff=2):
+
+def new_collection_name():
+    return f"{config.COLLECTION_NAME}_{time.strftime('%Y%m%d%H%M%S')}_{uuid4().hex[:6]}"
+
+
+def get_alias_target(client):
     """
-    Retry decorator to handle exceptions and retry the operation.
+    Returns the name of the collection the COLLECTION_NAME alias points to, or None if it is no alias.
     """
-    def deco_retry(f):
-        @wraps(f)
-        def f_retry(*args, **kwargs):
-            mtries, mdelay = tries, delay
-            while mtries > 0:
-                try:
-                    return f(*args, **kwargs)
-                except exceptions as e:
-                    print(f"Retrying due to {e}. Attempts left: {mtries - 1}")
-                    mtries -= 1
-                    time.sleep(mdelay)
-                    mdelay *= backoff
-            raise Exception("Maximum retries reached")
-        return f_retry
-    return deco_retry
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == config.COLLECTION_NAME:
+            return alias.collection_name
+    return None
 
-def get_pdf_last_modified_time(pdf_file_path):
+
+def switch_alias(client, collection_name):
+    """
+    Atomically points the COLLECTION_NAME alias, which the retriever queries, to `collection_name` and drops the
+    collection it pointed to before.
+
+    A deployment that still serves a plain collection named COLLECTION_NAME is migrated the first time: that
+    collection has to be dropped before the alias can take its name, so queries fail for that moment only.
+    """
+    old_collection_name = get_alias_target(client)
+    operations = []
+    if old_collection_name:
+        operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=config.COLLECTION_NAME)))
+    elif client.collection_exists(config.COLLECTION_NAME):
+        client.delete_collection(config.COLLECTION_NAME)
+    operations.append(CreateAliasOperation(create_alias=CreateAlias(collection_name=collection_name, alias_name=config.COLLECTION_NAME)))
+    client.update_collection_aliases(change_aliases_operations=operations)
+    print(f"Alias {config.COLLECTION_NAME} now points to {collection_name}.")
+
+    if old_collection_name and old_collection_name != collection_name:
+        client.delete_collection(old_collection_name)
+    # Cached answers are based on the previous collection
+    bump_collection_revision(client)
+
+
+def drop_collection(client):
     """
-    Get the last modified time of the PDF file.
+    Deletes the served collection, whether COLLECTION_NAME is an alias or a plain collection.
     """
-    return os.path.getmtime(pdf_file_path)
+    collection_name = get_alias_target(client)
+    if collection_name:
+        client.update_collection_aliases(change_aliases_operations=[
+            DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=config.COLLECTION_NAME))
+        ])
+        client.delete_collection(collection_name)
+    elif client.collection_exists(config.COLLECTION_NAME):
+        client.delete_collection(config.COLLECTION_NAME)
 
+def get_chunk_id(pdf_file_name, text):
+    """
+    Computes the deterministic point ID of a chunk: a UUID made from the SHA-256 of its source file name and text.
 
-def delete_old_chunks(client, pdf_file_name):
+    Unchanged chunks of an edited PDF keep their ID, so only new chunks need to be embedded and upserted.
+    """
+    return str(UUID(hashlib.sha256(f"{pdf_file_name}\0{text}".encode("utf-8")).hexdigest()[:32]))
+
+
+def load_collection_manifest(client, page_size=1000, collection_name=config.COLLECTION_NAME):
+    """
+    Reads the per-file state of the collection in one bulk scroll pass.
+
+    Returns:
+    dict: Maps each pdf_file_name in the collection to the set of content hashes stored for it.
+    """
+    if isinstance(client, LocalIndexWriter):
+        return client.load_manifest()
+
+    manifest = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=page_size,
+            offset=offset,
+            with_payload=[PDF_FILE_NAME_KEY, CONTENT_HASH_KEY],
+            with_vectors=False
+        )
+        for point in points:
+            metadata = (point.payload or {}).get("metadata") or {}
+            pdf_file_name = metadata.get("pdf_file_name")
+            if pdf_file_name:
+                manifest.setdefault(pdf_file_name, set()).add(metadata.get("content_hash"))
+        if offset is None:
+            return manifest
+
+
+def delete_old_chunks(client, pdf_file_name, collection_name=config.COLLECTION_NAME):
     """
     Deletes old chunks from the Qdrant collection based on the PDF file name.
     """
     try:
+        if isinstance(client, LocalIndexWriter):
+            client.delete_file(pdf_file_name)
+            return
         client.delete(
-            collection_name=config.COLLECTION_NAME,
-            filter={
-                "must": [
-                    {
-                        "key": "pdf_file_name",
-                        "match": {"value": pdf_file_name}
-                    }
-                ]
-            }
+            collection_name=collection_name,
+            points_selector=FilterSelector(filter=file_filter(pdf_file_name))
         )
         print(f"Deleted old chunks for {pdf_file_name}")
     except Exception as e:
         print(f"Failed to delete old chunks for {pdf_file_name}: {e}")
 
 
-@retry((Exception,), tries=10, delay=5, backoff=2)
-def process_pdf(pdf_file, client, embeddings, text_splitter):
+def file_filter(pdf_file_name):
+    return Filter(must=[FieldCondition(key=PDF_FILE_NAME_KEY, match=MatchValue(value=pdf_file_name))])
+
+
+def load_file_point_ids(client, pdf_file_name, page_size=1000, collection_name=config.COLLECTION_NAME):
     """
-    Processes a single PDF file, checks if it's new or updated, and ingests it into Qdrant.
+    Returns the ids of the points stored for `pdf_file_name`.
     """
-    try:
-        pdf_file_path = os.path.join('data', pdf_file)
-        last_modified_time = get_pdf_last_modified_time(pdf_file_path)
-
-        # Use the scroll method to find documents with matching pdf_file_name in metadata
-        existing_chunks = client.scroll(
-            collection_name=config.COLLECTION_NAME,
-            scroll_filter={
-                "must": [
-                    {"key": "pdf_file_name", "match": {"value": pdf_file}},
-                ]
-            },
-            limit=1,  # We only need to check if at least one chunk exists
-            with_payload=True
+    if isinstance(client, LocalIndexWriter):
+        return client.point_ids(pdf_file_name)
+
+    point_ids = set()
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=file_filter(pdf_file_name),
+            limit=page_size,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False
         )
+        point_ids.update(str(point.id) for point in points)
+        if offset is None:
+            return point_ids
 
-        # Check if we got any existing documents
-        if existing_chunks:
-            for chunk in existing_chunks[0]:  # Scroll returns a tuple (documents, next_offset)
-                existing_last_modified_time = chunk.payload.get("last_modified_time")
-                
-                # Case 1: If last modified times match, skip ingestion
-                if existing_last_modified_time == last_modified_time:
-                    print(f"No changes detected in {pdf_file}. Skipping ingestion.")
-                    return  # Skip ingestion if no changes
-                
-                # Case 2: If the PDF has been updated, delete old chunks
-                else:
-                    print(f"Detected changes in {pdf_file}. Updating chunks...")
-                    delete_old_chunks(client, pdf_file)
-                    break  # No need to continue scrolling, we found an update
-            
-        # Case 3: New PDF (no matching documents found), proceed with ingestion
-        else:
-            print(f"New PDF detected: {pdf_file}. Ingesting for the first time.")
-        
-        # Ingest new or updated chunks
-        docs = PyPDFLoader(file_path=pdf_file_path).load()
-        chunks = text_splitter.split_documents(docs)
 
-        # Add metadata (PDF file name and last modified time) to each chunk
+def delete_points(client, point_ids, collection_name=config.COLLECTION_NAME):
+    """
+    Deletes the points with the given ids.
+    """
+    if isinstance(client, LocalIndexWriter):
+        client.delete_points(point_ids)
+        return
+    client.delete(collection_name=collection_name, points_selector=PointIdsList(points=list(point_ids)))
+
+
+def update_content_hash(client, pdf_file_name, content_hash, collection_name=config.COLLECTION_NAME):
+    """
+    Tags every point of `pdf_file_name` with the file's new content hash, without rewriting the points.
+    """
+    if isinstance(client, LocalIndexWriter):
+        client.set_content_hash(pdf_file_name, content_hash)
+        return
+    client.set_payload(
+        collection_name=collection_name,
+        payload={"content_hash": content_hash},
+        points=FilterSelector(filter=file_filter(pdf_file_name)),
+        key=QdrantVectorStore.METADATA_KEY
+    )
+
+
+def sync_file_chunks(client, pdf_file_name, chunks, collection_name=config.COLLECTION_NAME):
+    """
+    Diffs the chunks of a PDF against the points stored for it. Points whose chunk vanished are deleted.
+
+    Returns:
+    list: The chunks that are not stored yet, the only ones that need to be embedded and upserted.
+    """
+    existing_ids = load_file_point_ids(client, pdf_file_name, collection_name=collection_name)
+    vanished_ids = existing_ids - {point_id for point_id, _, _ in chunks}
+    if vanished_ids:
+        delete_points(client, vanished_ids, collection_name)
+    new_chunks = [chunk for chunk in chunks if chunk[0] not in existing_ids]
+    print(f"{pdf_file_name}: {len(new_chunks)} new, {len(chunks) - len(new_chunks)} unchanged and {len(vanished_ids)} removed chunks.")
+    return new_chunks
+
+
+def parse_pdf(pdf_file, data_folder, content_hash):
+    """
+    Loads and splits a single PDF file. Runs inside a worker process of the parsing pool.
+
+    The page text comes from the page store, so only PDFs that were never extracted before are parsed by pypdf.
+
+    Returns:
+    tuple: (point ID, text, metadata) tuples for every distinct chunk of the PDF, and the time spent loading the PDF.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    pages = page_store.load_pages(os.path.join(data_folder, pdf_file), content_hash)
+
+    # Split page by page, as split_documents() does, without holding every page in memory
+    texts = []
+    load_seconds = 0.0
+    while True:
+        start = time.perf_counter()
+        page = next(pages, None)
+        load_seconds += time.perf_counter() - start
+        if page is None:
+            break
+        texts.extend(text_splitter.split_text(page[1]))
+
+    # Add metadata to each chunk. Repeated chunks share an ID and are stored once. The content hash is only set
+    # once every chunk of the file is stored, so a partly stored file is never taken for an ingested one.
+    metadata = {"pdf_file_name": pdf_file, "content_hash": None}
+    chunk_ids = {}
+    for text in texts:
+        chunk_ids.setdefault(get_chunk_id(pdf_file, text), text)
+    return [(point_id, text, dict(metadata)) for point_id, text in chunk_ids.items()], load_seconds
+
+
+def upsert_points(client, points, collection_name=config.COLLECTION_NAME):
+    """
+    Writes one batch of points into the Qdrant collection. Retries are left to the BulkUpserter.
+    """
+    with timed("upsert"):
+        if isinstance(client, LocalIndexWriter):
+            client.upsert(points)
+            return
+        client.upsert(collection_name=collection_name, points=points)
+
+
+def get_upsert_concurrency(client):
+    """
+    Returns how many upsert requests may be in flight. The local index and Qdrant's in-process mode
+    (":memory:" or a path) are not safe for concurrent writes, so they get one at a time.
+    """
+    if isinstance(client, LocalIndexWriter) or type(getattr(client, "_client", None)).__name__ == "QdrantLocal":
+        return 1
+    return config.UPSERT_CONCURRENCY
+
+
+def embed_stage(chunk_queue, point_queue, embeddings, embedding_cache, progress):
+    """
+    Collects chunks from all files into batches of EMBED_BATCH_SIZE and embeds the ones missing from the embedding cache.
+    """
+    batch = []
+
+    def flush():
+        try:
+            vectors = embedding_cache.get_many([point_id for point_id, _, _ in batch])
+            missing = [(point_id, text) for point_id, text, _ in batch if point_id not in vectors]
+            if missing:
+                with timed("embed_documents"):
+                    new_vectors = dict(zip(
+                        [point_id for point_id, _ in missing],
+                        embeddings.embed_documents([text for _, text in missing])
+                    ))
+                embedding_cache.set_many(new_vectors)
+                vectors.update(new_vectors)
+        except Exception as e:
+            print(f"Failed to embed {len(batch)} chunks: {e}")
+            progress.points_failed([metadata["pdf_file_name"] for _, _, metadata in batch], e)
+            batch.clear()
+            return
+        point_queue.put([
+            PointStruct(
+                id=point_id,
+                vector=vectors[point_id],
+                payload={
+                    QdrantVectorStore.CONTENT_KEY: text,
+                    QdrantVectorStore.METADATA_KEY: metadata
+                }
+            )
+            for point_id, text, metadata in batch
+        ])
+        batch.clear()
+
+    while (chunks := chunk_queue.get()) is not None:
         for chunk in chunks:
-            chunk.metadata = {
-                "pdf_file_name": pdf_file,
-                "last_modified_time": last_modified_time
-            }
-
-        # Ingest new chunks with metadata into Qdrant
-        vector_store = QdrantVectorStore.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            collection_name=config.COLLECTION_NAME,
-            url=config.QDRANT_URL,
-            api_key=config.QDRANT_API_KEY,
-            force_recreate=False
-        )
-        print(f"Document {pdf_file} ingested successfully.")
-    except Exception as e:
-        print(f"Failed to process {pdf_file}: {e}")
+            batch.append(chunk)
+            if len(batch) >= config.EMBED_BATCH_SIZE:
+                flush()
+    if batch:
+        flush()
+    point_queue.put(None)
+
+
+def run_pipeline(pdf_files, data_folder, client, embeddings, collection_name=config.COLLECTION_NAME):
+    """
+    Streams PDF files through the parse -> embed -> upsert stages.
+
+    Parsing is CPU-bound, so it runs in a process pool; embedding and upserting each run on their own
+    thread, the upserts through a BulkUpserter. The stages are connected by bounded queues, and at most
+    two parse jobs per worker are in flight, so memory stays flat regardless of the number of files, and
+    a slow Qdrant pauses parsing instead of piling up points.
+
+    Only the chunks that are not stored yet are embedded and upserted. As soon as every point of a file
+    was stored, all of its chunks are tagged with the file's new content hash. This checkpoints the
+    file: an interrupted or partly failed run leaves the other files with their old hash, and the next
+    ingest() picks them up again, embedding and upserting only the chunks that are still missing.
+
+    Parameters:
+    pdf_files (dict): Maps the PDF file names to ingest to their content hashes.
+    embeddings: The embedding executor (or any embedding model) the chunks are embedded with.
+    collection_name (str): The collection to write to, COLLECTION_NAME (the alias) unless a rebuild is building a new one.
+
+    Returns:
+    dict: The summary of the run, with the number of points upserted and failed, the number of completed
+    files and the error of every failed file.
+    """
+    chunk_queue = Queue(maxsize=config.INGEST_WORKERS * 2)
+    point_queue = Queue(maxsize=4)
+    embedding_cache = EmbeddingCache(
+        config.EMBEDDING_CACHE_PATH, getattr(embeddings, "model_name", None) or type(embeddings).__name__
+    )
+    progress = IngestProgress(partial(update_content_hash, client, collection_name=collection_name))
+    bulk_upserter = BulkUpserter(
+        partial(upsert_points, client, collection_name=collection_name), progress, concurrency=get_upsert_concurrency(client)
+    )
+
+    embedder = Thread(target=embed_stage, args=(chunk_queue, point_queue, embeddings, embedding_cache, progress), daemon=True)
+    upserter = Thread(target=bulk_upserter.run, args=(point_queue,), daemon=True)
+    embedder.start()
+    upserter.start()
+
+    pending = {}
+    files = iter(pdf_files.items())
+    try:
+        # The workers are spawned rather than forked: the embed and upsert threads (and the embedding executor,
+        # the Qdrant connection pool) are already running, and a fork could copy their locks in a held state.
+        # Every spawned worker re-imports the parsing libraries, so no more are started than there are files.
+        workers = min(config.INGEST_WORKERS, len(pdf_files))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) if workers else nullcontext() as executor:
+            while True:
+                while len(pending) < config.INGEST_WORKERS * 2:
+                    pdf_file, content_hash = next(files, (None, None))
+                    if pdf_file is None:
+                        break
+                    pending[executor.submit(parse_pdf, pdf_file, data_folder, content_hash)] = pdf_file
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pdf_file = pending.pop(future)
+                    try:
+                        chunks, load_seconds = future.result()
+                        observe_stage("pdf_load", load_seconds)
+                        print(f"Document {pdf_file} parsed into {len(chunks)} chunks.")
+                        new_chunks = sync_file_chunks(client, pdf_file, chunks, collection_name)
+                        progress.expect(pdf_file, len(new_chunks), pdf_files[pdf_file])
+                        chunk_queue.put(new_chunks)
+                    except Exception as e:
+                        print(f"Failed to process {pdf_file}: {e}")
+                        progress.file_failed(pdf_file, e)
+    finally:
+        chunk_queue.put(None)
+        embedder.join()
+        upserter.join()
+        embedding_cache.close()
+
+    summary = progress.summary()
+    print_summary(summary)
+    return summary
+
 
+def print_summary(summary):
+    print(f"Upserted {summary['upserted']} chunks, {summary['failed']} failed.")
+    if summary["failed_files"]:
+        print(f"{len(summary['failed_files'])} files failed and will be retried by the next ingest():")
+        for pdf_file, error in sorted(summary["failed_files"].items()):
+            print(f"  {pdf_file}: {error}")
 
-def ingest():
+
+def get_local_hashes(data_folder):
     """
-    Ingests all PDF files from the 'data' folder into the Qdrant collection.
+    Returns a dict mapping the PDF files in `data_folder` to their content hashes.
     """
-    data_folder = "data"
     if not os.path.exists(data_folder):
         raise FileNotFoundError(f"Folder {data_folder} does not exist.")
+    return {
+        f: get_pdf_content_hash(os.path.join(data_folder, f))
+        for f in os.listdir(data_folder) if f.endswith(".pdf")
+    }
 
-    client = QdrantClient(url=config.QDRANT_URL, api_key=config.QDRANT_API_KEY, timeout=120)
-    create_collection_if_not_exists(client)
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    embeddings = FastEmbedEmbeddings()
+def ingest(data_folder="data"):
+    """
+    Syncs the PDF files in `data_folder` with the Qdrant collection, or with the local index
+    when VECTOR_BACKEND is "local".
+
+    The collection's per-file state is read in one bulk pass and compared against the content
+    hash of every local PDF: unchanged files are skipped, new or edited files are (re-)ingested and
+    chunks of PDFs that were removed from the folder are deleted. Edited files only have their new
+    chunks embedded and upserted, and their vanished chunks deleted.
+
+    Returns:
+    dict: The summary of run_pipeline(), or None if nothing had to be ingested.
+    """
+    local_hashes = get_local_hashes(data_folder)
+
+    if config.VECTOR_BACKEND == "local":
+        client = LocalIndexWriter(config.LOCAL_INDEX_DIR, config.LOCAL_INDEX_QUANTIZATION)
+    else:
+        client = get_qdrant_client()
+        create_collection_if_not_exists(client)
+
+    manifest = load_collection_manifest(client)
+
+    removed_files = manifest.keys() - local_hashes.keys()
+    for pdf_file in removed_files:
+        print(f"PDF {pdf_file} was removed from {data_folder}. Deleting its chunks...")
+        delete_old_chunks(client, pdf_file)
+
+    pdf_files = {f: content_hash for f, content_hash in local_hashes.items() if manifest.get(f) != {content_hash}}
+    print(f"{len(local_hashes) - len(pdf_files)} PDF files unchanged, {len(pdf_files)} to ingest.")
+    if not pdf_files and not removed_files:
+        return
+
+    for pdf_file in pdf_files:
+        if pdf_file in manifest:
+            print(f"Detected changes in {pdf_file}. Updating chunks...")
+        else:
+            print(f"New PDF detected: {pdf_file}. Ingesting for the first time.")
+
+    summary = None
+    try:
+        if pdf_files:
+            summary = run_pipeline(pdf_files, data_folder, client, get_embedding_executor())
+    finally:
+        if isinstance(client, LocalIndexWriter):
+            client.commit()
+        # Cached answers may be based on chunks that were just replaced
+        bump_collection_revision(client)
+    return summary
 
-    pdf_files = [f for f in os.listdir(data_folder) if f.endswith(".pdf")]
-    batch_size = 3  # Adjust this according to your server's capacity
 
-    for i in range(0, len(pdf_files), batch_size):
-        batch = pdf_files[i:i + batch_size]
-        with ThreadPoolExecutor(max_workers=batch_size) as executor:
-            for pdf_file in batch:
-                executor.submit(process_pdf, pdf_file, client, embeddings, text_splitter)
+def rebuild(data_folder="data"):
+    """
+    Re-ingests every PDF in `data_folder` into a new collection while the current one keeps serving,
+    then atomically switches the COLLECTION_NAME alias to it. Queries never see a partially built collection.
+
+    With VECTOR_BACKEND "local", the index is rebuilt from scratch and swapped in by LocalIndexWriter.commit().
+    Chunks embedded before are taken from the embedding cache, so a rebuild mostly costs parsing and upserts.
+    """
+    local_hashes = get_local_hashes(data_folder)
+    print(f"Rebuilding the collection from {len(local_hashes)} PDF files...")
+
+    if config.VECTOR_BACKEND == "local":
+        client = LocalIndexWriter(config.LOCAL_INDEX_DIR, config.LOCAL_INDEX_QUANTIZATION)
+        client.clear()
+        stats = run_pipeline(local_hashes, data_folder, client, get_embedding_executor())
+        if stats["failed_files"]:
+            print("Rebuild failed, the live index is unchanged.")
+            return stats
+        client.commit()
+        bump_collection_revision(client)
+        return stats
+
+    client = get_qdrant_client()
+    collection_name = new_collection_name()
+    create_collection(client, collection_name)
+    try:
+        stats = run_pipeline(local_hashes, data_folder, client, get_embedding_executor(), collection_name)
+    except BaseException:
+        client.delete_collection(collection_name)
+        raise
+    if stats["failed_files"]:
+        print(f"Rebuild failed, {config.COLLECTION_NAME} is unchanged.")
+        client.delete_collection(collection_name)
+        return stats
+    switch_alias(client, collection_name)
+    return stats
+
+
+def get_folder_state(data_folder):
+    """
+    Returns the size and modification time of every PDF in `data_folder`, a cheap way to notice changes.
+    """
+    state = {}
+    for entry in os.scandir(data_folder):
+        if entry.name.endswith(".pdf") and entry.is_file():
+            stat = entry.stat()
+            state[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return state
+
+
+def watch(interval=None, rebuild_first=False, data_folder="data"):
+    """
+    Keeps the collection in sync with `data_folder`: polls the folder every `interval` seconds
+    (INGEST_WATCH_INTERVAL by default) and runs an incremental ingest() whenever a PDF was added, changed
+    or removed. Runs until interrupted.
+    """
+    interval = interval or config.INGEST_WATCH_INTERVAL
+    if rebuild_first:
+        rebuild(data_folder)
+    else:
+        ingest(data_folder)
+    state = get_folder_state(data_folder)
+    print(f"Watching {data_folder} for changes every {interval} seconds...")
+
+    while True:
+        time.sleep(interval)
+        new_state = get_folder_state(data_folder)
+        if new_state == state:
+            continue
+        # Wait for files that are still being copied into the folder
+        time.sleep(1)
+        if get_folder_state(data_folder) != new_state:
+            continue
+        print(f"Changes detected in {data_folder}.")
+        try:
+            ingest(data_folder)
+            state = new_state
+        except Exception as e:
+            # The folder state is kept, so the next poll retries
+            print(f"Failed to ingest changes: {e}")
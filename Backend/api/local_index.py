@@ -0,0 +1,302 @@
+from langchain_core.vectorstores import VectorStore # type: ignore
+from langchain_core.documents import Document # type: ignore
+from uuid import uuid4
+import numpy as np # type: ignore
+import threading
+import shutil
+import json
+import os
+
+# Embedded vector index stored as memory-mapped NumPy files, used instead of Qdrant when VECTOR_BACKEND is "local".
+#
+# Layout of the index directory:
+#   CURRENT          name of the live version directory, swapped atomically by LocalIndexWriter.commit()
+#   <version>/
+#     vectors.npy    float32 matrix of unit-normalized embeddings, one row per chunk
+#     int8.npy       optional int8 copy of the matrix, with per-row scales in scales.npy
+#     float16.npy    optional float16 copy of the matrix
+#     records.bin    JSON records ({"id", "page_content", "metadata"}) back to back
+#     offsets.npy    byte offset of every record in records.bin, plus the end offset
+#
+# Every file is opened with mmap_mode="r", so worker processes share the same page cache pages instead of each
+# loading its own copy, and only the rows that are actually scored or returned are read from disk.
+
+CURRENT_FILE = "CURRENT"
+
+
+def read_current_version(path):
+    """
+    Returns the name of the live version of the local index at `path`, or None if none was committed yet.
+    """
+    try:
+        with open(os.path.join(path, CURRENT_FILE)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.size == 0:
+        return matrix.reshape(len(matrix), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def _blocked_scores(matrix, query, block_size=8192):
+    """
+    Scores a quantized matrix against a float32 query block by block, so only one block at a time is
+    converted to float32.
+    """
+    scores = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), block_size):
+        scores[start:start + block_size] = matrix[start:start + block_size].astype(np.float32) @ query
+    return scores
+
+
+class LocalVectorIndex:
+    """
+    Read-only view of the live version of a local index, reopened automatically when a writer commits a new version.
+
+    Parameters:
+    path (str): The index directory.
+    quantization (str): "int8" or "float16" to score against the quantized copy and rescore the best
+        candidates exactly, or None to score against the float32 matrix directly.
+    rescore_factor (int): How many candidates per requested result are rescored exactly.
+    """
+
+    def __init__(self, path, quantization=None, rescore_factor=4):
+        self.path = path
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self._version = None
+        self._arrays = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        version = read_current_version(self.path)
+        if version is None:
+            raise FileNotFoundError(f"Local index {self.path} does not exist. Run ingest.py with VECTOR_BACKEND=local first.")
+
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    version_dir = os.path.join(self.path, version)
+                    arrays = {
+                        name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode="r")
+                        for name in ("vectors", "offsets")
+                    }
+                    if self.quantization == "int8":
+                        arrays["quantized"] = np.load(os.path.join(version_dir, "int8.npy"), mmap_mode="r")
+                        arrays["scales"] = np.load(os.path.join(version_dir, "scales.npy"), mmap_mode="r")
+                    elif self.quantization == "float16":
+                        arrays["quantized"] = np.load(os.path.join(version_dir, "float16.npy"), mmap_mode="r")
+                    arrays["records"] = np.memmap(os.path.join(version_dir, "records.bin"), dtype=np.uint8, mode="r") \
+                        if arrays["offsets"][-1] > 0 else np.zeros(0, dtype=np.uint8)
+                    self._arrays = arrays
+                    self._version = version
+        return self._arrays
+
+    def __len__(self):
+        return len(self._load()["vectors"])
+
+    def record(self, i):
+        """
+        Returns the stored record of row `i`.
+        """
+        arrays = self._load()
+        start, end = int(arrays["offsets"][i]), int(arrays["offsets"][i + 1])
+        return json.loads(arrays["records"][start:end].tobytes())
+
+    def search(self, query_vector, k=4):
+        """
+        Returns the `k` rows most similar to `query_vector`.
+
+        Returns:
+        list: (row, cosine similarity) tuples, best first.
+        """
+        arrays = self._load()
+        vectors = arrays["vectors"]
+        if len(vectors) == 0:
+            return []
+        query = _normalize_rows([query_vector])[0]
+        k = min(k, len(vectors))
+
+        if "quantized" in arrays:
+            # Coarse scores from the quantized copy, then exact scores for the best candidates only
+            coarse = _blocked_scores(arrays["quantized"], query)
+            if "scales" in arrays:
+                coarse = coarse * arrays["scales"]
+            n_candidates = min(k * self.rescore_factor, len(vectors))
+            candidates = np.sort(np.argpartition(-coarse, n_candidates - 1)[:n_candidates])
+            scores = vectors[candidates] @ query
+        else:
+            candidates = np.arange(len(vectors))
+            scores = vectors @ query
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+
+class LocalIndexWriter:
+    """
+    Builds a new version of a local index from the live one. Changes become visible to readers atomically on commit().
+    """
+
+    def __init__(self, path, quantization=None):
+        self.path = path
+        self.quantization = quantization
+        self.records = []
+        self.vectors = []
+        self._lock = threading.Lock()  # ingest() edits the index from the main and the upsert threads
+        os.makedirs(path, exist_ok=True)
+
+        if os.path.exists(os.path.join(path, CURRENT_FILE)):
+            index = LocalVectorIndex(path)
+            self.vectors = list(np.asarray(index._load()["vectors"]))
+            self.records = [index.record(i) for i in range(len(self.vectors))]
+
+    def load_manifest(self):
+        """
+        Returns a dict mapping each pdf_file_name in the index to the set of content hashes stored for it.
+        """
+        manifest = {}
+        for record in self.records:
+            metadata = record.get("metadata") or {}
+            if metadata.get("pdf_file_name"):
+                manifest.setdefault(metadata["pdf_file_name"], set()).add(metadata.get("content_hash"))
+        return manifest
+
+    def point_ids(self, pdf_file_name):
+        """
+        Returns the ids of the chunks of `pdf_file_name`.
+        """
+        with self._lock:
+            return {record["id"] for record in self.records if (record.get("metadata") or {}).get("pdf_file_name") == pdf_file_name}
+
+    def _keep(self, keep):
+        keep = [i for i, record in enumerate(self.records) if keep(record)]
+        self.records = [self.records[i] for i in keep]
+        self.vectors = [self.vectors[i] for i in keep]
+
+    def clear(self):
+        """
+        Removes every chunk, so the next commit() writes an index built from scratch.
+        """
+        with self._lock:
+            self.records, self.vectors = [], []
+
+    def delete_file(self, pdf_file_name):
+        """
+        Removes every chunk of `pdf_file_name`.
+        """
+        with self._lock:
+            self._keep(lambda record: (record.get("metadata") or {}).get("pdf_file_name") != pdf_file_name)
+
+    def delete_points(self, point_ids):
+        """
+        Removes the chunks with the given ids.
+        """
+        point_ids = {str(point_id) for point_id in point_ids}
+        with self._lock:
+            self._keep(lambda record: record["id"] not in point_ids)
+
+    def set_content_hash(self, pdf_file_name, content_hash):
+        """
+        Sets the content hash stored in the metadata of every chunk of `pdf_file_name`.
+        """
+        with self._lock:
+            for record in self.records:
+                metadata = record.get("metadata") or {}
+                if metadata.get("pdf_file_name") == pdf_file_name:
+                    metadata["content_hash"] = content_hash
+
+    def upsert(self, points):
+        """
+        Adds Qdrant-style points (`id`, `vector` and a page_content/metadata `payload`), replacing rows with the same id.
+        """
+        new_ids = {str(point.id) for point in points}
+        with self._lock:
+            if any(record["id"] in new_ids for record in self.records):
+                self._keep(lambda record: record["id"] not in new_ids)
+            for point in points:
+                self.records.append({"id": str(point.id), **point.payload})
+                self.vectors.append(np.asarray(point.vector, dtype=np.float32))
+
+    def commit(self):
+        """
+        Writes the index as a new version and atomically makes it the live one. Older versions are removed;
+        processes that still map them keep reading them until they reopen the index.
+        """
+        version = uuid4().hex
+        version_dir = os.path.join(self.path, version)
+        os.makedirs(version_dir)
+
+        vectors = _normalize_rows(self.vectors) if self.vectors else np.zeros((0, 384), dtype=np.float32)
+        np.save(os.path.join(version_dir, "vectors.npy"), vectors)
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0, dtype=np.float32)
+            scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+            np.save(os.path.join(version_dir, "int8.npy"), np.round(vectors / scales[:, None]).astype(np.int8))
+            np.save(os.path.join(version_dir, "scales.npy"), scales)
+        elif self.quantization == "float16":
+            np.save(os.path.join(version_dir, "float16.npy"), vectors.astype(np.float16))
+
+        offsets = [0]
+        with open(os.path.join(version_dir, "records.bin"), "wb") as f:
+            for record in self.records:
+                data = json.dumps(record).encode("utf-8")
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        np.save(os.path.join(version_dir, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+
+        current_tmp = os.path.join(self.path, f"{CURRENT_FILE}.{version}")
+        with open(current_tmp, "w") as f:
+            f.write(version)
+        os.replace(current_tmp, os.path.join(self.path, CURRENT_FILE))
+
+        for name in os.listdir(self.path):
+            if name not in (version, CURRENT_FILE) and os.path.isdir(os.path.join(self.path, name)):
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        print(f"Local index {self.path} committed with {len(self.records)} chunks.")
+
+
+class LocalVectorStore(VectorStore):
+    """
+    LangChain vector store backed by a LocalVectorIndex. Read-only: the index is written by ingest().
+    """
+
+    def __init__(self, index, embedding):
+        self.index = index
+        self.embedding = embedding
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+        results = []
+        for row, score in self.index.search(embedding, k):
+            record = self.index.record(row)
+            metadata = record.get("metadata") or {}
+            metadata["_id"] = record["id"]
+            results.append((Document(page_content=record.get("page_content", ""), metadata=metadata), score))
+        return results
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        # Same normalization as QdrantVectorStore for cosine similarity
+        return lambda score: (score + 1.0) / 2.0
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("The local index is written by ingest().")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("The local index is written by ingest().")
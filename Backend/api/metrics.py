@@ -0,0 +1,120 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+import time
+
+# Lightweight in-process metrics, exposed in the Prometheus text format on /metrics.
+
+PREFIX = "educampus_"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_histograms = {}  # (name, labels) -> [bucket counts..., count, sum]
+_counters = {}  # (name, labels) -> value
+_lock = threading.Lock()
+
+# Stage timings of the current request, for the Server-Timing response header
+_request_timings = ContextVar("request_timings", default=None)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def observe(name, value, **labels):
+    """
+    Records `value` in the histogram `name`.
+    """
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.setdefault(key, [0] * (len(BUCKETS) + 2))
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram[i] += 1
+        histogram[-2] += 1
+        histogram[-1] += value
+
+
+def increment(name, value=1, **labels):
+    """
+    Adds `value` to the counter `name`.
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe_stage(stage, seconds, **labels):
+    """
+    Records the duration of a pipeline stage, both in the stage histogram and in the current request's timings.
+    """
+    observe("stage_duration_seconds", seconds, stage=stage, **labels)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((".".join([stage, *map(str, labels.values())]), seconds))
+
+
+@contextmanager
+def timed(stage, **labels):
+    """
+    Context manager timing the enclosed block as the pipeline stage `stage`.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, **labels)
+
+
+def start_request_timing():
+    """
+    Starts collecting the stage timings of the current request.
+    """
+    _request_timings.set([])
+
+
+def server_timing_header():
+    """
+    Formats the stage timings of the current request as a Server-Timing header value.
+    """
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in _request_timings.get() or [])
+
+
+def _escape_label_value(value):
+    # Backslashes, double quotes and line feeds are the characters the text format requires to be escaped
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    labels = list(labels) + list(extra)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label_value(v)}"' for k, v in labels) + "}"
+
+
+def render_prometheus():
+    """
+    Renders every metric in the Prometheus text exposition format.
+    """
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, list(values)) for key, values in _histograms.items())
+
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            seen.add(name)
+        lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), values in histograms:
+        if name not in seen:
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            seen.add(name)
+        for bound, count in zip(BUCKETS, values):
+            lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {values[-2]}")
+        lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {values[-2]}")
+        lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {values[-1]}")
+
+    return "\n".join(lines) + "\n"
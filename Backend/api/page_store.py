@@ -0,0 +1,107 @@
+from uuid import uuid4
+import hashlib
+import gzip
+import json
+import os
+from api.metrics import increment
+from config import config
+
+# Content-addressed store of the text extracted from PDFs, so every file goes through pypdf only once no matter
+# how often it is re-chunked, re-ingested or uploaded again.
+#
+# Layout of the store directory:
+#   <first two hex digits of the hash>/<SHA-256 of the PDF>.jsonl.gz
+#       gzip-compressed JSON lines, one {"page": <0-based page number>, "text": ...} object per page
+#
+# Pages are read and written one line at a time, so large PDFs are never held in memory as a whole.
+
+
+def get_content_hash(file):
+    """
+    Computes the SHA-256 hash of a file's contents, e.g. of an audio recording. `file` is a path or a seekable
+    binary file, which is rewound afterwards.
+    """
+    sha256 = hashlib.sha256()
+    if hasattr(file, "read"):
+        file.seek(0)
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            sha256.update(block)
+        file.seek(0)
+        return sha256.hexdigest()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def get_pdf_content_hash(pdf_file):
+    """
+    Computes the SHA-256 hash of the PDF file's contents, the key of the page store and the upload index cache.
+
+    Unlike the modification time, the content hash is stable across checkouts and Docker builds.
+    """
+    return get_content_hash(pdf_file)
+
+
+class PageStore:
+    """
+    On-disk cache of the page text of PDFs, keyed by the content hash of the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _file(self, content_hash):
+        return os.path.join(self.path, content_hash[:2], f"{content_hash}.jsonl.gz")
+
+    def __contains__(self, content_hash):
+        return os.path.exists(self._file(content_hash))
+
+    def read_pages(self, content_hash):
+        """
+        Yields the stored (page number, text) tuples of a PDF one at a time.
+        """
+        with gzip.open(self._file(content_hash), "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                yield record["page"], record["text"]
+
+    def write_pages(self, content_hash, pages):
+        """
+        Passes the (page number, text) tuples of `pages` through while storing them. The entry only becomes
+        visible once every page was written, so readers never see a partially extracted PDF.
+        """
+        file_path = self._file(content_hash)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.{uuid4().hex}.tmp"
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                for page, text in pages:
+                    f.write(json.dumps({"page": page, "text": text}) + "\n")
+                    yield page, text
+            os.replace(tmp_path, file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load_pages(self, file_path, content_hash):
+        """
+        Yields the (page number, text) tuples of every page of the PDF at `file_path`, from the store if the
+        file was extracted before, or extracted with pypdf page by page and stored otherwise. `file_path` may
+        also be a seekable binary file, e.g. an upload buffered in memory.
+        """
+        if content_hash in self:
+            increment("cache_requests_total", cache="page_store", result="hit")
+            return self.read_pages(content_hash)
+
+        from pypdf import PdfReader # type: ignore
+
+        increment("cache_requests_total", cache="page_store", result="miss")
+        pages = (
+            (page_number, page.extract_text(extraction_mode="plain"))
+            for page_number, page in enumerate(PdfReader(file_path).pages)
+        )
+        return self.write_pages(content_hash, pages)
+
+
+page_store = PageStore(config.PAGE_STORE_DIR)
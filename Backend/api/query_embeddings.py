@@ -0,0 +1,54 @@
+import asyncio
+from langchain_core.embeddings import Embeddings # type: ignore
+from api.cache import normalize_query
+from api.metrics import timed
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps the embedding executor with an LRU cache of query embeddings keyed on the normalized query text.
+    Document embeddings are passed through unchanged.
+    """
+
+    def __init__(self, executor, cache):
+        self.executor = executor
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        return self.executor.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            with timed("embed_query"):
+                vector = self.executor.embed_query(text)
+            self.cache.set(key, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        """
+        Async variant of `embed_query`: awaits the executor's Future instead of blocking a thread on it.
+        """
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            with timed("embed_query"):
+                vector = await asyncio.wrap_future(self.executor.submit_query(text))
+            self.cache.set(key, vector)
+        return vector
+
+    def embed_queries(self, texts):
+        """
+        Embeds several queries, computing the ones missing from the cache in a single batched model call.
+        """
+        keys = [normalize_query(text) for text in texts]
+        vectors = [self.cache.get(key) for key in keys]
+        missing = {key: text for key, text, vector in zip(keys, texts, vectors) if vector is None}
+        if missing:
+            with timed("embed_query", batch="true"):
+                new_vectors = self.executor.submit_queries(missing.values()).result()
+            missing = dict(zip(missing, new_vectors))
+            for key, vector in missing.items():
+                self.cache.set(key, vector)
+        return [vector if vector is not None else missing[key] for key, vector in zip(keys, vectors)]
@@ -0,0 +1,205 @@
+import threading
+from config import config
+
+# Process-wide registry of the expensive clients and models shared by every blueprint.
+#
+# The client libraries are imported inside the factories, so importing the app stays fast and each library
+# is only loaded once something uses it.
+_resources = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def get_resource(name, factory):
+    """
+    Returns the shared resource registered under `name`, building it with `factory` on first use.
+
+    Parameters:
+    name (str): Registry key of the resource.
+    factory (callable): Builds the resource. Called at most once per process, even under concurrent access.
+
+    Returns:
+    object: The shared resource.
+    """
+    resource = _resources.get(name)
+    if resource is not None:
+        return resource
+
+    with _registry_lock:
+        lock = _locks.setdefault(name, threading.Lock())
+    with lock:
+        if name not in _resources:
+            _resources[name] = factory()
+            print(f"Initialized shared resource {name}.")
+        return _resources[name]
+
+
+def register_resource(name, resource):
+    """
+    Registers (or replaces) a shared resource, e.g. to wire an in-memory Qdrant client for local runs.
+    """
+    with _registry_lock:
+        _resources[name] = resource
+
+
+def get_qdrant_client():
+    """
+    Returns the shared Qdrant client. Its HTTP connection pool is reused across requests.
+    """
+    def build_client():
+        from qdrant_client import QdrantClient # type: ignore
+        return QdrantClient(url=config.QDRANT_URL, api_key=config.QDRANT_API_KEY, timeout=120)
+
+    return get_resource("qdrant_client", build_client)
+
+
+def get_async_qdrant_client():
+    """
+    Returns the shared asyncio Qdrant client of the async serving mode (async_app.py).
+    """
+    def build_client():
+        from qdrant_client import AsyncQdrantClient # type: ignore
+        return AsyncQdrantClient(url=config.QDRANT_URL, api_key=config.QDRANT_API_KEY, timeout=120)
+
+    return get_resource("async_qdrant_client", build_client)
+
+
+def get_embeddings():
+    """
+    Returns the shared FastEmbed model. The ONNX model is loaded only once per process, or once in the
+    gunicorn master when PRELOAD_MODEL is set.
+    """
+    def build_embeddings():
+        from langchain_community.embeddings import FastEmbedEmbeddings # type: ignore
+        # ONNX Runtime thread pools do not survive a fork, so a preloaded model runs single-threaded
+        threads = config.EMBEDDING_THREADS or (1 if config.PRELOAD_MODEL else None)
+        return FastEmbedEmbeddings(threads=threads)
+
+    return get_resource("embeddings", build_embeddings)
+
+
+def get_embedding_executor():
+    """
+    Returns the shared micro-batching executor in front of the embedding model. Request handlers and ingestion
+    embed through it, so concurrent calls are batched together instead of oversubscribing the CPU.
+    """
+    def build_executor():
+        from api.embedding_executor import EmbeddingExecutor
+        return EmbeddingExecutor(
+            get_embeddings(),
+            max_batch_size=config.EMBEDDING_MAX_BATCH,
+            max_wait=config.EMBEDDING_MAX_WAIT_MS / 1000,
+            workers=config.EMBEDDING_WORKERS
+        )
+
+    return get_resource("embedding_executor", build_executor)
+
+
+def get_groq_http_client():
+    """
+    Returns the HTTP connection pool shared by the Groq and ChatGroq clients.
+    """
+    def build_http_client():
+        import httpx # type: ignore
+        return httpx.Client(
+            timeout=120,
+            limits=httpx.Limits(max_connections=config.GROQ_MAX_CONNECTIONS, max_keepalive_connections=config.GROQ_MAX_CONNECTIONS)
+        )
+
+    return get_resource("groq_http_client", build_http_client)
+
+
+def get_groq_async_http_client():
+    """
+    Returns the asyncio HTTP connection pool shared by the AsyncGroq and ChatGroq clients in the async serving mode.
+    """
+    def build_http_client():
+        import httpx # type: ignore
+        return httpx.AsyncClient(
+            timeout=120,
+            limits=httpx.Limits(max_connections=config.GROQ_MAX_CONNECTIONS, max_keepalive_connections=config.GROQ_MAX_CONNECTIONS)
+        )
+
+    return get_resource("groq_async_http_client", build_http_client)
+
+
+def get_groq_client():
+    """
+    Returns the shared Groq client used for audio transcription.
+    """
+    def build_client():
+        from groq import Groq # type: ignore
+        return Groq(api_key=config.GROQ_API_KEY, http_client=get_groq_http_client())
+
+    return get_resource("groq_client", build_client)
+
+
+def get_async_groq_client():
+    """
+    Returns the shared AsyncGroq client used for audio transcription in the async serving mode.
+    """
+    def build_client():
+        from groq import AsyncGroq # type: ignore
+        return AsyncGroq(api_key=config.GROQ_API_KEY, http_client=get_groq_async_http_client())
+
+    return get_resource("async_groq_client", build_client)
+
+
+def get_chat_model(model_name=config.MODEL_NAME):
+    """
+    Returns the shared ChatGroq model for `model_name`. Its async methods (`ainvoke`, `astream`) use the
+    asyncio connection pool.
+    """
+    def build_model():
+        from langchain_groq import ChatGroq # type: ignore
+        return ChatGroq(
+            groq_api_key=config.GROQ_API_KEY, model_name=model_name,
+            http_client=get_groq_http_client(), http_async_client=get_groq_async_http_client()
+        )
+
+    return get_resource(f"chat_model:{model_name}", build_model)
+
+
+_ready = threading.Event()
+
+
+def preload_model():
+    """
+    Loads the embedding model and runs its first inference. Safe to call in the gunicorn master before
+    the workers are forked: it starts no threads and opens no connections, and the workers share the
+    model's memory pages copy-on-write.
+    """
+    get_embeddings().embed_query("warmup")
+
+
+def warmup():
+    """
+    Initializes every shared resource up front, so the first request does not pay for it.
+    """
+    get_qdrant_client()
+    preload_model()
+    get_groq_client()
+    get_chat_model()
+    get_chat_model(config.FAST_MODEL_NAME)
+    _ready.set()
+
+
+def start_warmup():
+    """
+    Runs `warmup()` on a background thread, so the server accepts connections while it warms up.
+    """
+    def run():
+        try:
+            warmup()
+        except Exception as e:
+            print(f"Warmup failed: {e}")
+
+    threading.Thread(target=run, name="warmup", daemon=True).start()
+
+
+def is_ready():
+    """
+    Checks whether warmup has finished. Without WARMUP_ON_BOOT resources load on first use, so the process
+    is ready right away.
+    """
+    return _ready.is_set() or not config.WARMUP_ON_BOOT
@@ -1,16 +1,160 @@
 from flask import Blueprint, jsonify, request # type: ignore
-from qdrant_client import QdrantClient # type: ignore
-from langchain_qdrant import QdrantVectorStore # type: ignore
-from langchain_community.embeddings import FastEmbedEmbeddings # type: ignore
+from api.resources import get_resource, get_qdrant_client, get_async_qdrant_client, get_embedding_executor
+from api.cache import query_embedding_cache
+from api.metrics import timed
 from config import config
 
 retrieval_blueprint = Blueprint('retrieval', __name__)
 
-qdrant_client = QdrantClient(url=config.QDRANT_URL, api_key=config.QDRANT_API_KEY)
-embeddings = FastEmbedEmbeddings()
-vector_store = QdrantVectorStore(client=qdrant_client, collection_name=config.COLLECTION_NAME, embedding=embeddings)
+def get_query_embeddings():
+    """
+    Returns the shared embedding executor wrapped with the query embedding LRU cache.
+    """
+    def build_query_embeddings():
+        from api.query_embeddings import CachedQueryEmbeddings
+        return CachedQueryEmbeddings(get_embedding_executor(), query_embedding_cache)
+
+    return get_resource("query_embeddings", build_query_embeddings)
+
+def get_retriever():
+    """
+    Returns the shared retriever for the chatbot collection, served from Qdrant or, when VECTOR_BACKEND
+    is "local", from the memory-mapped local index.
+    """
+    def build_retriever():
+        if config.VECTOR_BACKEND == "local":
+            from api.local_index import LocalVectorIndex, LocalVectorStore
+            index = LocalVectorIndex(config.LOCAL_INDEX_DIR, config.LOCAL_INDEX_QUANTIZATION, config.LOCAL_INDEX_RESCORE_FACTOR)
+            vector_store = LocalVectorStore(index, embedding=get_query_embeddings())
+        else:
+            from langchain_qdrant import QdrantVectorStore # type: ignore
+            vector_store = QdrantVectorStore(client=get_qdrant_client(), collection_name=config.COLLECTION_NAME, embedding=get_query_embeddings())
+        return vector_store.as_retriever(search_type="similarity_score_threshold", search_kwargs={"k": 8, "score_threshold": 0.5})
 
-retriever = vector_store.as_retriever(search_type="similarity_score_threshold", search_kwargs={"k": 8, "score_threshold": 0.5})
+    return get_resource("retriever", build_retriever)
+
+def retrieve_documents(query, purpose="query"):
+    """
+    Retrieves the documents relevant to `query` from the chatbot collection, timing the search.
+
+    Parameters:
+    purpose (str): Label of the search in the metrics, e.g. "speculative" or "refined".
+    """
+    with timed("retrieve", purpose=purpose):
+        return get_retriever().get_relevant_documents(query)
+
+async def aretrieve_documents(query, purpose="query"):
+    """
+    Async variant of `retrieve_documents` for the async serving mode. On Qdrant, the query is embedded through
+    the executor and searched with the asyncio client, so waiting for either holds no thread; the in-process
+    local index is searched on a worker thread.
+    """
+    import asyncio
+    from api.local_index import LocalVectorStore
+
+    retriever = get_retriever()
+    if isinstance(retriever.vectorstore, LocalVectorStore):
+        return await asyncio.to_thread(retrieve_documents, query, purpose)
+
+    with timed("retrieve", purpose=purpose):
+        vector = await get_query_embeddings().aembed_query(query)
+        points = await get_async_qdrant_client().search(
+            collection_name=config.COLLECTION_NAME, query_vector=vector,
+            limit=retriever.search_kwargs["k"], with_payload=True
+        )
+    return filter_relevant(documents_from_points(points), retriever.search_kwargs["score_threshold"])
+
+def documents_from_points(points):
+    """
+    Converts scored Qdrant points of the chatbot collection into (document, score) pairs.
+    """
+    from langchain_qdrant import QdrantVectorStore # type: ignore
+
+    return [
+        (QdrantVectorStore._document_from_point(
+            point, config.COLLECTION_NAME, QdrantVectorStore.CONTENT_KEY, QdrantVectorStore.METADATA_KEY
+        ), point.score)
+        for point in points
+    ]
+
+def filter_relevant(results, score_threshold):
+    """
+    Keeps the documents of (document, cosine similarity) pairs whose relevance passes `score_threshold`, with the
+    same relevance normalization as the "similarity_score_threshold" retriever.
+    """
+    return [doc for doc, score in results if (score + 1.0) / 2.0 >= score_threshold]
+
+def retrieve_documents_batch(queries, k=None, score_threshold=None):
+    """
+    Retrieves the documents relevant to each of `queries` with one embedding pass and, on Qdrant, one batch
+    search request.
+
+    Parameters:
+    k (int): Maximum number of documents per query. Defaults to the retriever's `k`.
+    score_threshold (float): Minimum relevance score, normalized to [0, 1] as in the retriever (`(cosine + 1) / 2`).
+        Defaults to the retriever's threshold.
+
+    Returns:
+    list: One list of documents per query, best first.
+    """
+    from qdrant_client.http.models import SearchRequest # type: ignore
+    from api.local_index import LocalVectorStore
+
+    retriever = get_retriever()
+    k = k or retriever.search_kwargs["k"]
+    score_threshold = retriever.search_kwargs["score_threshold"] if score_threshold is None else score_threshold
+
+    with timed("retrieve", purpose="batch"):
+        vectors = get_query_embeddings().embed_queries(queries)
+        vector_store = retriever.vectorstore
+        if isinstance(vector_store, LocalVectorStore):
+            results = [vector_store.similarity_search_with_score_by_vector(vector, k) for vector in vectors]
+        else:
+            points = get_qdrant_client().search_batch(
+                collection_name=config.COLLECTION_NAME,
+                requests=[SearchRequest(vector=vector, limit=k, with_payload=True) for vector in vectors]
+            )
+            results = [documents_from_points(query_points) for query_points in points]
+
+    return [filter_relevant(query_results, score_threshold) for query_results in results]
+
+def serialize_documents(docs):
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+
+def parse_retrieve_batch(data):
+    """
+    Validates the JSON body of a /retrieve_batch request.
+
+    Returns:
+    tuple: The queries, `k` and `score_threshold`, the latter two None if not given.
+
+    Raises:
+    ValueError: With the message for the client if the body is invalid.
+    """
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not queries or not all(isinstance(query, str) and query for query in queries):
+        raise ValueError("queries must be a non-empty list of strings.")
+    if len(queries) > config.RETRIEVE_BATCH_MAX_QUERIES:
+        raise ValueError(f"At most {config.RETRIEVE_BATCH_MAX_QUERIES} queries per request.")
+
+    k = data.get("k")
+    if k is not None:
+        try:
+            k = int(k)
+        except (TypeError, ValueError):
+            raise ValueError("k must be a positive integer.")
+        if k < 1:
+            raise ValueError("k must be a positive integer.")
+
+    score_threshold = data.get("score_threshold")
+    if score_threshold is not None:
+        try:
+            score_threshold = float(score_threshold)
+        except (TypeError, ValueError):
+            raise ValueError("score_threshold must be a number between 0 and 1.")
+        if not 0 <= score_threshold <= 1:
+            raise ValueError("score_threshold must be a number between 0 and 1.")
+    return queries, k, score_threshold
 
 @retrieval_blueprint.route('/retrieve', methods=['POST'])
 def retrieve():
@@ -19,9 +163,23 @@ def retrieve():
     """
     data = request.get_json()
     query = data.get("query", "What is the purpose of this document?")
-    results = retriever.get_relevant_documents(query)
+    results = retrieve_documents(query)
     
-    serialized_results = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in results]
+    serialized_results = serialize_documents(results)
     
     return jsonify({"query": query, "results": serialized_results})
 
+@retrieval_blueprint.route('/retrieve_batch', methods=['POST'])
+def retrieve_batch():
+    """
+    Endpoint to retrieve relevant documents for a list of queries in one request.
+    """
+    try:
+        queries, k, score_threshold = parse_retrieve_batch(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    results = retrieve_documents_batch(queries, k=k, score_threshold=score_threshold)
+    return jsonify({"results": [
+        {"query": query, "results": serialize_documents(docs)} for query, docs in zip(queries, results)
+    ]})
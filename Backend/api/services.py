@@ -0,0 +1,352 @@
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Iterator, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+import numpy as np # type: ignore
+import tempfile
+import os
+from api.retrieval import retrieve_documents, get_query_embeddings
+from api.common import run_chain, stream_chain, get_prompt_template
+from api.resources import get_resource, get_embedding_executor, get_groq_client
+from api.cache import answer_cache, transcript_cache, normalize_query, get_collection_revision
+from api.upload_index import UploadIndex, upload_index_cache
+from api.page_store import page_store, get_content_hash, get_pdf_content_hash
+from api.single_flight import SingleFlight
+from api.context_packer import pack_context
+from api.metrics import timed
+from api.transcription import get_audio_duration, plan_segments, extract_segment, stitch_transcripts
+from config import config
+
+# RAG flows shared by the blueprints and the top-level /api/query and /api/upload_audio routes.
+
+
+class InvalidRequestError(ValueError):
+    """
+    Raised when a service is called with invalid input. Routes answer it with a 400.
+    """
+
+
+TRANSCRIPTION_MODEL = "whisper-large-v3"
+
+# Concurrent requests with the same normalized query and context share one retrieval and LLM call
+generation_flights = SingleFlight("generation")
+chat_with_pdf_flights = SingleFlight("chat_with_pdf")
+
+
+@dataclass
+class GenerationRequest:
+    query: str
+    stream: bool = False
+
+
+@dataclass
+class ChatWithPdfRequest:
+    query: str
+    file_path: Optional[str] = None
+    stream: bool = False
+    file: Optional[BinaryIO] = None  # Uploaded PDF held in a buffer, parsed from there instead of `file_path`
+    file_name: Optional[str] = None  # Name of the uploaded PDF, the source of its documents
+    content_hash: Optional[str] = None  # SHA-256 of the PDF, if already computed while receiving the upload
+
+
+@dataclass
+class TranscriptionRequest:
+    file_path: str
+    content_hash: Optional[str] = None  # SHA-256 of the file, if already computed while saving the upload
+
+
+@dataclass
+class Answer:
+    """
+    Result of a RAG flow. Holds either the full `response` or, for streamed requests, the `tokens` iterator;
+    `on_complete` must then be called with the full response once the stream is exhausted.
+    """
+    query: str
+    response: Optional[str] = None
+    tokens: Optional[Iterator[str]] = None
+    on_complete: Optional[Callable[[str], None]] = None
+    found: bool = True
+
+
+@dataclass
+class Transcription:
+    text: str
+
+
+def generate_answer(request):
+    """
+    Generates an answer to a question using documents retrieved from the chatbot collection.
+
+    Parameters:
+    request (GenerationRequest): The question and whether the answer should be streamed.
+
+    Returns:
+    Answer: The generated answer. `found` is False when no relevant documents were retrieved.
+    """
+    query = request.query
+
+    # inputs = {"question": query}
+    # prompt_template = get_prompt_template("refine_query")
+    # query = run_chain(prompt_template, inputs)
+    # print(query)
+
+    # Serve repeated questions from the semantic answer cache. The revision is read once, so an answer computed
+    # from the collection before an ingest() is not cached as one computed from the collection after it.
+    revision = get_collection_revision()
+    query_vector = get_query_embeddings().embed_query(query)
+    answer = answer_cache.get(query_vector)
+    if answer is not None:
+        return Answer(query=query, response=answer)
+
+    def produce():
+        results = retrieve_documents(query)
+        packed = pack_context(results, use_case="generation")
+        context = packed.text
+        print(f"Context packed into {packed.tokens_after} tokens, {packed.tokens_saved} saved.")
+
+        if not context:
+            return None
+
+        # Always streamed, so a streaming request that joins the flight of a non-streaming one still receives
+        # the tokens as they are generated
+        inputs = {"context": context, "question": query}
+        return stream_chain(get_prompt_template("generation"), inputs)
+
+    flight = generation_flights.join(
+        ("generation", normalize_query(query), revision), produce,
+        on_complete=lambda answer: answer_cache.set(query_vector, answer, revision)
+    )
+    return flight_answer(query, flight, request.stream)
+
+
+def chat_with_pdf(request):
+    """
+    Answers a question about an uploaded PDF, combined with documents from the chatbot collection.
+
+    Parameters:
+    request (ChatWithPdfRequest): The question, the optional newly uploaded PDF (a path, or a buffer with its
+        content hash) and whether the answer should be streamed.
+
+    Returns:
+    Answer: The generated answer.
+    """
+    query = request.query
+    file_path = request.file_path
+    print(request.file_name or file_path)
+
+    # Validate inputs
+    if not query:
+        raise InvalidRequestError("No query provided")
+
+    if file_path and not os.path.exists(file_path):
+        raise InvalidRequestError("File not found or path invalid")
+
+    # A buffered upload usually comes with its hash, so a PDF seen before is found without reading it again
+    pdf_file = request.file if request.file is not None else file_path or None
+    content_hash = request.content_hash
+    if content_hash is None and pdf_file is not None:
+        content_hash = get_pdf_content_hash(pdf_file)
+
+    def produce():
+        # Search the chatbot collection with the original query while the PDF and the refined query are
+        # processed; the results are reused if the refined query turns out to be close enough
+        speculative_results = None
+        if config.CONCURRENT_CHAT_WITH_PDF:
+            speculative_results = get_stage_executor().submit(copy_context().run, retrieve_documents, query, "speculative")
+
+        # Step 1: Query the uploaded PDF's in-memory index
+        pdf_results = []
+        if pdf_file is not None:
+            index = get_upload_index(pdf_file, content_hash, source=request.file_name)
+            pdf_results = index.search(get_query_embeddings().embed_query(query), k=3, score_threshold=0.5)
+        packed_pdf = pack_context(pdf_results, use_case="chat_with_pdf")
+        pdf_context = packed_pdf.text
+        print(pdf_context)
+
+        # Step 2: Use LLM to generate a refined query
+        inputs_for_refined_query = {"context": pdf_context, "question": query}
+        refined_query_template = get_prompt_template("refined_query")
+        refined_query = run_chain(refined_query_template, inputs_for_refined_query)
+        print(f"Refined query: {refined_query}")
+
+        # Step 3: Use the refined query to fetch information from the chatbot collection
+        if speculative_results is not None and is_similar_query(query, refined_query):
+            chatbot_results = speculative_results.result()
+            print("Reusing the chatbot collection results of the original query.")
+        else:
+            chatbot_results = retrieve_documents(refined_query, "refined")
+        packed_chatbot = pack_context(chatbot_results, use_case="chat_with_pdf")
+        chatbot_context = packed_chatbot.text
+        print(f"Context packed into {packed_pdf.tokens_after + packed_chatbot.tokens_after} tokens, "
+              f"{packed_pdf.tokens_saved + packed_chatbot.tokens_saved} saved.")
+
+        # Step 4: Combine all contexts and generate the final response
+        final_inputs = chat_with_pdf_inputs(query, refined_query, pdf_context, chatbot_context)
+        return stream_chain(get_prompt_template("chat_with_pdf"), final_inputs)
+
+    flight = chat_with_pdf_flights.join(
+        ("chat_with_pdf", normalize_query(query), content_hash, get_collection_revision()), produce
+    )
+    return flight_answer(query, flight, request.stream)
+
+
+def chat_with_pdf_inputs(query, refined_query, pdf_context, chatbot_context):
+    """
+    Builds the inputs of the final chat-with-PDF prompt from the contexts of the PDF and the chatbot collection.
+    """
+    combined_context = f"""
+            [PDF Collection Context]:
+            {pdf_context}
+
+            [Chatbot Collection Context]:
+            {chatbot_context}
+        """
+    return {
+        "context": combined_context,
+        "question": query,
+        "refined_query": refined_query
+    }
+
+
+def transcribe_audio(request):
+    """
+    Converts an audio file to text using the Groq API.
+
+    Recordings longer than AUDIO_SEGMENT_SECONDS are split into overlapping segments that are transcribed
+    concurrently, and transcripts are cached by content hash so repeated clips are not transcribed again.
+
+    Parameters:
+    request (TranscriptionRequest): The path of the audio file.
+
+    Returns:
+    Transcription: The transcribed text.
+    """
+    file_path = request.file_path
+    if not file_path or not os.path.exists(file_path):
+        raise InvalidRequestError("File not found.")
+
+    content_hash = request.content_hash or get_content_hash(file_path)
+    text = transcript_cache.get(content_hash)
+    if text is not None:
+        return Transcription(text=text)
+
+    with timed("transcribe"):
+        segments = plan_segments(get_audio_duration(file_path), config.AUDIO_SEGMENT_SECONDS, config.AUDIO_SEGMENT_OVERLAP)
+        if len(segments) == 1:
+            text = transcribe_segment(file_path)
+        else:
+            with tempfile.TemporaryDirectory() as segment_dir:
+                futures = [
+                    get_stage_executor().submit(copy_context().run, transcribe_segment, file_path, start, duration, segment_dir)
+                    for start, duration in segments
+                ]
+                text = stitch_transcripts([future.result() for future in futures])
+
+    transcript_cache.set(content_hash, text)
+    return Transcription(text=text)
+
+
+def transcribe_segment(file_path, start=None, duration=None, segment_dir=None):
+    """
+    Transcribes the whole file, or the segment of `duration` seconds starting at `start`.
+    """
+    if start is not None:
+        file_path = extract_segment(file_path, start, duration, segment_dir)
+
+    # Use the shared Groq client for transcription, streaming the file instead of reading it into memory
+    with open(file_path, "rb") as file, timed("transcribe_segment"):
+        transcription = get_groq_client().audio.transcriptions.create(
+            file=(os.path.basename(file_path), file),
+            model=TRANSCRIPTION_MODEL,
+            response_format="verbose_json",
+        )
+    return transcription.text
+
+
+def flight_answer(query, flight, stream):
+    """
+    Turns a generation flight into an `Answer`, streaming its tokens or waiting for the full response.
+    """
+    if not flight.wait_found():
+        return Answer(query=query, found=False)
+    if stream:
+        return Answer(query=query, tokens=flight.subscribe())
+    return Answer(query=query, response=flight.result())
+
+
+def get_stage_executor():
+    """
+    Returns the shared thread pool that runs independent pipeline stages concurrently.
+    """
+    return get_resource("stage_executor", lambda: ThreadPoolExecutor(
+        max_workers=config.STAGE_WORKERS, thread_name_prefix="stage"
+    ))
+
+
+def is_similar_query(query, other_query):
+    """
+    Checks whether the embeddings of two queries are at least SPECULATIVE_SEARCH_THRESHOLD similar.
+    """
+    embeddings = get_query_embeddings()
+    return is_similar_vector(embeddings.embed_query(query), embeddings.embed_query(other_query))
+
+
+def is_similar_vector(vector, other_vector):
+    """
+    Checks whether two query embeddings are at least SPECULATIVE_SEARCH_THRESHOLD similar.
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    other_vector = np.asarray(other_vector, dtype=np.float32)
+    similarity = vector @ other_vector / ((np.linalg.norm(vector) * np.linalg.norm(other_vector)) or 1.0)
+    return similarity >= config.SPECULATIVE_SEARCH_THRESHOLD
+
+
+def get_upload_index(file_path, content_hash=None, source=None):
+    """
+    Returns the in-memory index of an uploaded PDF, given by its path or as a binary file. Indexes are cached
+    by content hash, so uploading the same file again does not parse or embed it a second time.
+
+    Parameters:
+    source (str): Name of the PDF in the metadata of its documents. Defaults to `file_path`.
+    """
+    content_hash = content_hash or get_pdf_content_hash(file_path)
+
+    def build_index():
+        documents = process_file_data(file_path, content_hash, source)
+        with timed("embed_documents"):
+            vectors = get_embedding_executor().embed_documents([doc.page_content for doc in documents])
+        print(f"File {source or file_path} processed and indexed in memory.")
+        return UploadIndex(documents, vectors)
+
+    return upload_index_cache.get_or_build(content_hash, build_index)
+
+def process_file_data(file_path, content_hash=None, source=None):
+    """
+    Process the uploaded PDF file and convert its content to documents for vectorization.
+
+    Args:
+        file_path (str | BinaryIO): Path to the uploaded file, or a seekable binary file holding it.
+        content_hash (str): SHA-256 of the file, if already computed. Used as the page store key.
+        source (str): Source of the documents in their metadata. Defaults to `file_path`.
+
+    Returns:
+        List[Document]: A list of Document objects with fields like `page_content` and `metadata`.
+    """
+    from langchain_core.documents import Document # type: ignore
+
+    documents = []
+    try:
+        with timed("process_file_data"):
+            # Read the PDF pages, extracted by pypdf only if the file is not in the page store yet
+            with timed("pdf_load"):
+                for i, text in page_store.load_pages(file_path, content_hash or get_pdf_content_hash(file_path)):
+                    if text:  # Add only non-empty pages
+                        documents.append(Document(
+                            page_content=text.strip(),
+                            metadata={"source": source or file_path, "page": i + 1}
+                        ))
+    except Exception as e:
+        raise ValueError(f"Error processing file: {e}")
+
+    return documents
+
@@ -0,0 +1,222 @@
+import asyncio
+from contextvars import copy_context
+from threading import Condition, Lock, Thread
+from api.metrics import increment
+
+# Request coalescing: concurrent requests for the same answer join one in-flight computation instead of each
+# running their own retrieval and LLM call.
+
+
+class Flight:
+    """
+    One in-flight answer computation. Its tokens are recorded as they are produced and replayed to every
+    request that joins it, whether the request streams the answer or waits for the full response.
+    """
+
+    def __init__(self):
+        self.found = None
+        self._tokens = []
+        self._done = False
+        self._error = None
+        self._condition = Condition()
+
+    def run(self, produce, on_complete=None):
+        """
+        Runs `produce`, which returns the answer tokens, or None when no relevant context was found.
+        `on_complete` is called with the full response once every token was produced.
+        """
+        try:
+            tokens = produce()
+            with self._condition:
+                self.found = tokens is not None
+                self._condition.notify_all()
+            for token in tokens or ():
+                with self._condition:
+                    self._tokens.append(token)
+                    self._condition.notify_all()
+            if self.found and on_complete:
+                on_complete("".join(self._tokens))
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._condition:
+                self._done = True
+                self._condition.notify_all()
+
+    def wait_found(self):
+        """
+        Waits until the context was retrieved. Returns whether any was found, or raises the error of the flight.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.found is not None or self._done)
+        if self.found is None:
+            raise self._error
+        return self.found
+
+    def subscribe(self):
+        """
+        Yields every token of the answer, the ones already produced first.
+        """
+        i = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: i < len(self._tokens) or self._done)
+                if i < len(self._tokens):
+                    token = self._tokens[i]
+                elif self._error is not None:
+                    raise self._error
+                else:
+                    return
+            i += 1
+            yield token
+
+    def result(self):
+        """
+        Waits for the full response.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._done)
+        if self._error is not None:
+            raise self._error
+        return "".join(self._tokens)
+
+
+class SingleFlight:
+    """
+    Registry of the in-flight computations of one pipeline, keyed by what determines their answer.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._flights = {}
+        self._lock = Lock()
+
+    def join(self, key, produce, on_complete=None):
+        """
+        Returns the flight computing `key`, starting it with `produce` if none is in flight.
+
+        The flight runs on its own thread, so it completes for every joined request even if the request
+        that started it goes away.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                increment("single_flight_requests_total", flight=self.name, result="joined")
+                return flight
+            flight = self._flights[key] = Flight()
+        increment("single_flight_requests_total", flight=self.name, result="started")
+
+        def run():
+            try:
+                flight.run(produce, on_complete)
+            finally:
+                with self._lock:
+                    del self._flights[key]
+
+        Thread(target=copy_context().run, args=(run,), name=f"flight-{self.name}", daemon=True).start()
+        return flight
+
+    def __len__(self):
+        return len(self._flights)
+
+
+class AsyncFlight:
+    """
+    asyncio counterpart of `Flight` for the async serving mode. `produce` is a coroutine function returning the
+    answer tokens, as a list or an async iterator, or None when no relevant context was found.
+    """
+
+    def __init__(self):
+        self.found = None
+        self._tokens = []
+        self._done = False
+        self._error = None
+        self._condition = asyncio.Condition()
+
+    async def _notify(self):
+        async with self._condition:
+            self._condition.notify_all()
+
+    async def run(self, produce, on_complete=None):
+        try:
+            tokens = await produce()
+            self.found = tokens is not None
+            await self._notify()
+            if hasattr(tokens, "__aiter__"):
+                async for token in tokens:
+                    self._tokens.append(token)
+                    await self._notify()
+            else:
+                for token in tokens or ():
+                    self._tokens.append(token)
+                await self._notify()
+            if self.found and on_complete:
+                on_complete("".join(self._tokens))
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done = True
+            await self._notify()
+
+    async def wait_found(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.found is not None or self._done)
+        if self.found is None:
+            raise self._error
+        return self.found
+
+    async def subscribe(self):
+        i = 0
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(lambda: i < len(self._tokens) or self._done)
+                if i < len(self._tokens):
+                    token = self._tokens[i]
+                elif self._error is not None:
+                    raise self._error
+                else:
+                    return
+            i += 1
+            yield token
+
+    async def result(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._done)
+        if self._error is not None:
+            raise self._error
+        return "".join(self._tokens)
+
+
+class AsyncSingleFlight:
+    """
+    Registry of the in-flight computations of one pipeline in the async serving mode. Flights run as tasks on
+    the event loop, so they complete for every joined request even if the request that started it goes away.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._flights = {}
+
+    def join(self, key, produce, on_complete=None):
+        flight = self._flights.get(key)
+        if flight is not None:
+            increment("single_flight_requests_total", flight=self.name, result="joined")
+            return flight
+        flight = self._flights[key] = AsyncFlight()
+        increment("single_flight_requests_total", flight=self.name, result="started")
+
+        async def run():
+            try:
+                await flight.run(produce, on_complete)
+            finally:
+                del self._flights[key]
+
+        # The flight holds a reference to its task, so it is not garbage collected while running
+        flight.task = asyncio.create_task(run())
+        return flight
+
+    def __contains__(self, key):
+        return key in self._flights
+
+    def __len__(self):
+        return len(self._flights)
@@ -0,0 +1,116 @@
+import subprocess
+import shutil
+import wave
+import os
+import re
+
+# Splitting of long recordings into overlapping segments that are transcribed concurrently and stitched back
+# together. WAV files are split with the standard library; every other format needs ffmpeg on the PATH and is
+# sent to Whisper whole when it is missing.
+
+
+def is_wav(file_path):
+    with open(file_path, "rb") as f:
+        header = f.read(12)
+    return header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+
+def get_audio_duration(file_path):
+    """
+    Returns the duration of the audio file in seconds, or None if it cannot be determined.
+    """
+    if is_wav(file_path):
+        try:
+            with wave.open(file_path, "rb") as f:
+                return f.getnframes() / f.getframerate()
+        except (wave.Error, EOFError):
+            pass  # Compressed or float WAV, let ffprobe handle it
+
+    if shutil.which("ffprobe") is None:
+        return None
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", file_path],
+        capture_output=True, text=True
+    )
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        return None
+
+
+def plan_segments(duration, segment_seconds, overlap_seconds):
+    """
+    Splits a recording of `duration` seconds into segments of `segment_seconds`, each extended by `overlap_seconds`
+    into the next one so words cut at a boundary are transcribed whole at least once.
+
+    Returns:
+    list: (start, duration) tuples in order. A single (0, None) segment means the file is sent whole.
+    """
+    if duration is None or duration <= segment_seconds + overlap_seconds:
+        return [(0.0, None)]
+    segments = []
+    start = 0.0
+    # Stop once the rest of the recording is already covered by the previous segment's overlap
+    while not segments or start + overlap_seconds < duration:
+        segments.append((start, min(segment_seconds + overlap_seconds, duration - start)))
+        start += segment_seconds
+    return segments
+
+
+def extract_segment(file_path, start, duration, segment_dir):
+    """
+    Writes the segment of the recording starting at `start` seconds to `segment_dir`.
+
+    Returns:
+    str: The path of the segment file.
+    """
+    if is_wav(file_path):
+        try:
+            segment_path = os.path.join(segment_dir, f"segment_{start:.0f}.wav")
+            with wave.open(file_path, "rb") as source, wave.open(segment_path, "wb") as segment:
+                rate = source.getframerate()
+                source.setpos(int(start * rate))
+                segment.setparams(source.getparams())
+                segment.writeframes(source.readframes(int(duration * rate)))
+            return segment_path
+        except (wave.Error, EOFError):
+            pass
+
+    # 16 kHz mono FLAC is what Whisper resamples to anyway, and keeps the uploads small
+    segment_path = os.path.join(segment_dir, f"segment_{start:.0f}.flac")
+    subprocess.run(
+        [
+            "ffmpeg", "-nostdin", "-v", "error", "-ss", str(start), "-t", str(duration), "-i", file_path,
+            "-ac", "1", "-ar", "16000", "-c:a", "flac", segment_path
+        ],
+        check=True, capture_output=True
+    )
+    return segment_path
+
+
+def _words(text):
+    return [re.sub(r"[^\w']", "", word).lower() for word in text.split()]
+
+
+def stitch_transcripts(texts, max_overlap_words=20):
+    """
+    Joins the transcripts of consecutive overlapping segments, dropping the words at the start of each segment
+    that repeat the end of the previous one.
+    """
+    result = ""
+    for text in texts:
+        text = text.strip()
+        if not result:
+            result = text
+            continue
+        previous = _words(" ".join(result.split()[-max_overlap_words:]))
+        current = _words(text)
+        overlap = 0
+        for n in range(min(len(previous), len(current), max_overlap_words), 0, -1):
+            if previous[-n:] == current[:n]:
+                overlap = n
+                break
+        remaining = " ".join(text.split()[overlap:])
+        if remaining:
+            result = f"{result} {remaining}"
+    return result
@@ -0,0 +1,126 @@
+from collections import OrderedDict
+import numpy as np # type: ignore
+import threading
+import time
+from api.metrics import increment
+from config import config
+
+
+class UploadIndex:
+    """
+    In-memory vector index over the pages of one uploaded PDF.
+    """
+
+    def __init__(self, documents, vectors):
+        self.documents = documents
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(documents), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms == 0, 1.0, norms)
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + sum(len(doc.page_content) for doc in self.documents)
+
+    def search(self, query_vector, k=3, score_threshold=None):
+        """
+        Returns the `k` documents most similar to `query_vector`.
+
+        Parameters:
+        score_threshold (float): Minimum relevance score, normalized to [0, 1] the same way as
+            the Qdrant retrievers (`(cosine + 1) / 2`).
+
+        Returns:
+        list: The matching documents, best first.
+        """
+        if not self.documents:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = (self.matrix @ query + 1.0) / 2.0
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            self.documents[i] for i in top
+            if score_threshold is None or scores[i] >= score_threshold
+        ]
+
+
+class UploadIndexCache:
+    """
+    Thread-safe LRU cache of upload indexes keyed by the content hash of the uploaded PDF.
+
+    Entries expire after `ttl` seconds, and the least recently used entries are evicted once the
+    indexes together exceed `max_bytes`.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # content hash -> (index, expiry)
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self._build_locks = {}
+
+    def _evict(self):
+        now = time.monotonic()
+        for content_hash in [h for h, (_, expiry) in self._entries.items() if expiry < now]:
+            self._nbytes -= self._entries.pop(content_hash)[0].nbytes
+        while self._nbytes > self.max_bytes and len(self._entries) > 1:
+            self._nbytes -= self._entries.popitem(last=False)[1][0].nbytes
+
+    def _get(self, content_hash):
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(content_hash)
+            if entry is None:
+                return None
+            self._entries[content_hash] = (entry[0], time.monotonic() + self.ttl)
+            self._entries.move_to_end(content_hash)
+            return entry[0]
+
+    def get_or_build(self, content_hash, build):
+        """
+        Returns the index for `content_hash`, calling `build` to create it if it is not cached.
+        Concurrent uploads of the same file build the index only once.
+        """
+        index = self._get(content_hash)
+        if index is not None:
+            self.hits += 1
+            increment("cache_requests_total", cache="upload_index", result="hit")
+            return index
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(content_hash, threading.Lock())
+        with build_lock:
+            index = self._get(content_hash)
+            if index is not None:
+                self.hits += 1
+                increment("cache_requests_total", cache="upload_index", result="hit")
+                return index
+
+            self.misses += 1
+            increment("cache_requests_total", cache="upload_index", result="miss")
+            try:
+                index = build()
+                with self._lock:
+                    self._entries[content_hash] = (index, time.monotonic() + self.ttl)
+                    self._nbytes += index.nbytes
+                    self._evict()
+            finally:
+                # Also when the build failed, e.g. for an unreadable PDF, so failed uploads do not pile up locks
+                with self._lock:
+                    self._build_locks.pop(content_hash, None)
+            return index
+
+    def stats(self):
+        return {
+            "size": len(self._entries), "nbytes": self._nbytes, "max_bytes": self.max_bytes,
+            "hits": self.hits, "misses": self.misses
+        }
+
+
+upload_index_cache = UploadIndexCache(config.UPLOAD_INDEX_MAX_BYTES, config.UPLOAD_INDEX_TTL)
@@ -1,27 +1,80 @@
-from flask import Flask, jsonify, request # type: ignore
+from flask import Flask, Response, jsonify, request # type: ignore
 from api.retrieval import retrieval_blueprint
 from api.generation import generation_blueprint
 from api.chat_with_pdf import chat_blueprint
 from api.audio_conversion import audio_blueprint
+from api.resources import preload_model, start_warmup, is_ready
+from api.common import wants_stream, answer_response, UploadRequest
+from api.metrics import observe, start_request_timing, server_timing_header, render_prometheus
+from api.services import GenerationRequest, ChatWithPdfRequest, TranscriptionRequest, generate_answer, chat_with_pdf, transcribe_audio
 from config import config
 from flask_cors import CORS # type: ignore
 from werkzeug.utils import secure_filename # type: ignore
+import tempfile
+import time
 import os
 
 app = Flask(__name__)
+# Uploaded files are received into hashing in-memory buffers, see UploadRequest
+app.request_class = UploadRequest
 app.config.from_object(config)
 CORS(app, supports_credentials=False)
 
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB
 
+# With PRELOAD_MODEL, the embedding model is loaded while the app is imported. Under gunicorn with
+# preload_app (see gunicorn.conf.py) that happens once in the master, and every worker then warms up its own
+# clients after the fork. Otherwise the shared clients and the model load in the background.
+if config.PRELOAD_MODEL:
+    preload_model()
+elif config.WARMUP_ON_BOOT:
+    start_warmup()
+
 # Register the blueprints for modular routes
 app.register_blueprint(retrieval_blueprint, url_prefix="/api/retrieval")
 app.register_blueprint(generation_blueprint, url_prefix="/api/generation")
 app.register_blueprint(chat_blueprint, url_prefix="/api/chat_with_pdf")
 app.register_blueprint(audio_blueprint, url_prefix="/api/audio_conversion")
 
-UPLOAD_FOLDER = './uploads'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+@app.before_request
+def start_timing():
+    request.start_time = time.perf_counter()
+    start_request_timing()
+
+@app.after_request
+def record_timing(response):
+    """
+    Records the request latency per endpoint and, if enabled, adds the per-stage breakdown as a Server-Timing header.
+    Streamed responses, such as Server-Sent Events, are timed until the stream ends rather than until the headers.
+    """
+    start, endpoint, status = request.start_time, request.endpoint or "unknown", response.status_code
+
+    def record():
+        observe("http_request_duration_seconds", time.perf_counter() - start, endpoint=endpoint, status=status)
+
+    if response.is_streamed:
+        response.call_on_close(record)
+    else:
+        record()
+    if config.TIMING_HEADERS:
+        response.headers["Server-Timing"] = server_timing_header()
+    return response
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+    Readiness probe: 200 once warmup has finished, 503 while the process is still warming up.
+    """
+    if is_ready():
+        return jsonify({"ready": True}), 200
+    return jsonify({"ready": False}), 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Route exposing the latency histograms, token counts and cache counters in the Prometheus text format.
+    """
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
 
 @app.route('/api/query', methods=['POST'])
 def query():
@@ -30,35 +83,42 @@ def query():
     """
     query = request.form.get("query", "")
     uploaded_file = request.files.get("file")
+    stream = wants_stream(request.form.get("stream"))
 
     if not query:
         return jsonify({"error": "No query provided."}), 400
 
-    if uploaded_file:
-        # Save the uploaded file
-        filename = secure_filename(uploaded_file.filename)
-        file_path = os.path.join(UPLOAD_FOLDER, filename).replace("\\", "/")
-        uploaded_file.save(file_path)
-
-        # Call the chat_with_pdf endpoint
-        response = app.test_client().post(
-            '/api/chat_with_pdf/generate',
-            json={"file": file_path, "query": query}
-        ).get_data(as_text=True)
-        return jsonify({"response": response}), 200
-
-    # Call the text generation endpoint if no file is uploaded
-    response = app.test_client().post(
-        '/api/generation/generate',
-        json={"query": query}
-    ).get_data(as_text=True)
-    return jsonify({"response": response}), 200
+    try:
+        if uploaded_file:
+            # Parse the PDF straight from the buffer it was received into. It was hashed on the way in, so a
+            # PDF uploaded before is served from the upload index cache without being read again.
+            answer = chat_with_pdf(ChatWithPdfRequest(
+                query=query, file=uploaded_file.stream, file_name=secure_filename(uploaded_file.filename),
+                content_hash=uploaded_file.stream.content_hash, stream=stream
+            ))
+            fields = {}
+        else:
+            # Generate from the chatbot collection if no file is uploaded
+            answer = generate_answer(GenerationRequest(query=query, stream=stream))
+            fields = {"query": query}
+
+        if not answer.found:
+            payload = {"answer": "I don't know the answer."}
+        elif stream:
+            return answer_response(answer, stream, **fields)
+        else:
+            payload = {**fields, "response": answer.response}
+    except Exception as e:
+        payload = {"error": str(e)}
+
+    # The client expects the JSON payload of the answer as a string
+    return jsonify({"response": app.json.dumps(payload)}), 200
 
 
 @app.route('/api/upload_audio', methods=['POST'])
 def audio():
     """
-    Route to handle audio file uploads and invoke the audio conversion endpoint.
+    Route to handle audio file uploads and transcribe them.
     """
     if 'audio' not in request.files:
         return jsonify({"error": "No audio file provided."}), 400
@@ -67,20 +127,23 @@ def audio():
     if not audio_file.filename:
         return jsonify({"error": "Empty file uploaded."}), 400
 
-    # Save the audio file securely
-    filename = secure_filename(audio_file.filename)
-    file_path = os.path.join(UPLOAD_FOLDER, filename).replace("\\", "/")
-    audio_file.save(file_path)
-
-    # Call the audio conversion endpoint
-    response = app.test_client().post(
-        '/api/audio_conversion/convert',
-        json={"file": file_path}
-    ).get_data(as_text=True)
-    return jsonify({"response": response}), 200
+    # ffmpeg needs the recording on disk. Every upload gets its own temporary directory, removed once it is
+    # transcribed, so concurrent uploads with the same name never overwrite each other. The file is written from
+    # the buffer that was hashed for the transcript cache while the upload was received.
+    try:
+        with tempfile.TemporaryDirectory(prefix="audio_upload_") as upload_dir:
+            file_path = os.path.join(upload_dir, secure_filename(audio_file.filename) or "recording")
+            audio_file.save(file_path)
+            transcription = transcribe_audio(TranscriptionRequest(file_path=file_path, content_hash=audio_file.stream.content_hash))
+        payload = {"transcription": transcription.text}
+    except Exception as e:
+        payload = {"error": str(e)}
+    return jsonify({"response": app.json.dumps(payload)}), 200
 
 
 if __name__ == "__main__":
+    if config.PRELOAD_MODEL and config.WARMUP_ON_BOOT:
+        start_warmup()
     app.run(debug=config.DEBUG)
 
 # python -m venv myenv   
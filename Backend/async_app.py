@@ -0,0 +1,426 @@
+"""
+Async serving mode of the API on aiohttp, with the same routes and request/response formats as app.py.
+
+The Flask app holds one thread per request while it waits for Qdrant, the LLM or Whisper, so the number of
+requests in flight is capped by the worker threads. Here the requests are served by the async flows of
+api/async_services.py, which await the asyncio Qdrant and Groq clients and the async LangChain chain, so a
+single process multiplexes hundreds of in-flight requests. Run from the Backend folder:
+
+    python async_app.py
+
+or with gunicorn, one event loop per worker process:
+
+    gunicorn -c gunicorn.conf.py async_app:app --worker-class aiohttp.GunicornWebWorker
+"""
+from aiohttp import web # type: ignore
+from api.async_services import generate_answer, chat_with_pdf, transcribe_audio
+from api.services import GenerationRequest, ChatWithPdfRequest, TranscriptionRequest, InvalidRequestError
+from api.retrieval import aretrieve_documents, retrieve_documents_batch, parse_retrieve_batch, serialize_documents
+from api.resources import preload_model, start_warmup, is_ready
+from api.cache import answer_cache, query_embedding_cache
+from api.upload_index import upload_index_cache
+from api.common import sse_event, model_stats, HashingSpooledFile
+from api.metrics import observe, start_request_timing, server_timing_header, render_prometheus
+from config import config
+from werkzeug.utils import secure_filename # type: ignore
+import functools
+import asyncio
+import tempfile
+import shutil
+import time
+import json
+import os
+
+MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB, as in app.py
+
+# Same JSON encoding as Flask's jsonify, which sorts the keys
+dumps = functools.partial(json.dumps, sort_keys=True)
+
+if config.PRELOAD_MODEL:
+    preload_model()
+elif config.WARMUP_ON_BOOT:
+    start_warmup()
+
+routes = web.RouteTableDef()
+
+
+def json_response(payload, status=200):
+    return web.json_response(payload, status=status, dumps=dumps)
+
+
+def wants_stream(request, flag=None):
+    """
+    Checks whether the client asked for a streamed response, either with a truthy `stream` field
+    or with an `Accept: text/event-stream` header.
+    """
+    if isinstance(flag, str):
+        flag = flag.lower() in ['true', '1', 't']
+    accept = request.headers.get("Accept", "").split(",")[0].split(";")[0].strip()
+    return bool(flag) or accept == "text/event-stream"
+
+
+async def read_json(request):
+    """
+    Returns the JSON body of the request, or None if it is not JSON.
+    """
+    if request.content_type != "application/json":
+        return None
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def sse_response(request, tokens, on_complete=None, **fields):
+    """
+    Streams tokens to the client as Server-Sent Events, in the format of `common.sse_response`.
+    """
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no"
+    })
+    await response.prepare(request)
+    parts = []
+    try:
+        if hasattr(tokens, "__aiter__"):
+            async for token in tokens:
+                parts.append(token)
+                await response.write(sse_event({"token": token}).encode("utf-8"))
+        else:
+            for token in tokens:
+                parts.append(token)
+                await response.write(sse_event({"token": token}).encode("utf-8"))
+        answer = "".join(parts)
+        if on_complete:
+            on_complete(answer)
+        await response.write(sse_event({**fields, "response": answer}, event="done").encode("utf-8"))
+    except ConnectionResetError:
+        raise
+    except Exception as e:
+        await response.write(sse_event({"error": str(e)}, event="error").encode("utf-8"))
+    await response.write_eof()
+    return response
+
+
+async def answer_response(request, answer, stream, **fields):
+    """
+    Renders an `Answer` from the service layer as a JSON response, or as Server-Sent Events if `stream` is set.
+    """
+    if answer.tokens is not None or stream:
+        tokens = answer.tokens if answer.tokens is not None else [answer.response]
+        return await sse_response(request, tokens, on_complete=answer.on_complete, **fields)
+    return json_response({**fields, "response": answer.response})
+
+
+async def receive_upload(part, block_size=1024 * 1024):
+    """
+    Receives an uploaded multipart file into a `HashingSpooledFile`, which hashes it in the same pass and only
+    touches the disk above UPLOAD_SPOOL_MAX_BYTES.
+
+    Returns:
+    HashingSpooledFile: The buffer, rewound to the start.
+
+    Raises:
+    web.HTTPRequestEntityTooLarge: If the file exceeds MAX_CONTENT_LENGTH.
+    """
+    buffer = HashingSpooledFile()
+    size = 0
+    try:
+        while block := await part.read_chunk(block_size):
+            size += len(block)
+            if size > MAX_CONTENT_LENGTH:
+                raise web.HTTPRequestEntityTooLarge(max_size=MAX_CONTENT_LENGTH, actual_size=size)
+            buffer.write(block)
+    except BaseException:
+        buffer.close()
+        raise
+    buffer.seek(0)
+    return buffer
+
+
+async def read_form(request):
+    """
+    Reads a form request, receiving uploaded files into buffers as they arrive. The caller closes the buffers.
+
+    Returns:
+    tuple: The form fields, and for every file field its `(filename, buffer)`, or None if the file was sent
+        without a filename.
+    """
+    if request.content_length and request.content_length > MAX_CONTENT_LENGTH:
+        raise web.HTTPRequestEntityTooLarge(max_size=MAX_CONTENT_LENGTH, actual_size=request.content_length)
+    if request.content_type != "multipart/form-data":
+        return dict(await request.post()), {}
+
+    fields, files = {}, {}
+    try:
+        async for part in await request.multipart():
+            if part.filename is None:
+                fields[part.name] = (await part.read()).decode("utf-8", "replace")
+            elif part.filename:
+                files[part.name] = (secure_filename(part.filename), await receive_upload(part))
+            else:
+                files[part.name] = None
+    except BaseException:
+        close_uploads(files)
+        raise
+    return fields, files
+
+
+def close_uploads(files):
+    for upload in files.values():
+        if upload is not None:
+            upload[1].close()
+
+
+def save_file(buffer, file_path):
+    with open(file_path, "wb") as f:
+        shutil.copyfileobj(buffer, f)
+
+
+@web.middleware
+async def timing_middleware(request, handler):
+    """
+    Records the request latency per endpoint, named as in the Flask app, and answers CORS preflight requests.
+    """
+    start = time.perf_counter()
+    start_request_timing()
+    endpoint = request.match_info.route.name or "unknown"
+    try:
+        if request.method == "OPTIONS" and "Access-Control-Request-Method" in request.headers:
+            response = web.Response(headers={
+                "Access-Control-Allow-Methods": request.headers["Access-Control-Request-Method"],
+                "Access-Control-Allow-Headers": request.headers.get("Access-Control-Request-Headers", "*"),
+            })
+        else:
+            response = await handler(request)
+    except web.HTTPException as e:
+        observe("http_request_duration_seconds", time.perf_counter() - start, endpoint=endpoint, status=e.status)
+        raise
+    observe("http_request_duration_seconds", time.perf_counter() - start, endpoint=endpoint, status=response.status)
+    return response
+
+
+async def add_headers(request, response):
+    # Called right before the headers are sent, so streamed responses get them as well
+    if "Origin" in request.headers:
+        response.headers["Access-Control-Allow-Origin"] = "*"
+    if config.TIMING_HEADERS:
+        response.headers["Server-Timing"] = server_timing_header()
+
+
+@routes.get('/ready', name="ready")
+async def ready(request):
+    """
+    Readiness probe: 200 once warmup has finished, 503 while the process is still warming up.
+    """
+    if is_ready():
+        return json_response({"ready": True})
+    return json_response({"ready": False}, status=503)
+
+
+@routes.get('/metrics', name="metrics")
+async def metrics(request):
+    """
+    Route exposing the latency histograms, token counts and cache counters in the Prometheus text format.
+    """
+    return web.Response(body=render_prometheus().encode("utf-8"), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+@routes.post('/api/query', name="query")
+async def query(request):
+    """
+    Route to handle user choice between retrieval, generation, and chat with PDF modes.
+    """
+    fields, files = await read_form(request)
+    try:
+        return await answer_query(request, fields, files.get("file"))
+    finally:
+        close_uploads(files)
+
+
+async def answer_query(request, fields, uploaded_file):
+    query = fields.get("query", "")
+    stream = wants_stream(request, fields.get("stream"))
+
+    if not query:
+        return json_response({"error": "No query provided."}, status=400)
+
+    try:
+        if uploaded_file:
+            # Parse the PDF straight from the buffer it was received and hashed into
+            file_name, buffer = uploaded_file
+            answer = await chat_with_pdf(ChatWithPdfRequest(
+                query=query, file=buffer, file_name=file_name, content_hash=buffer.content_hash, stream=stream
+            ))
+            response_fields = {}
+        else:
+            # Generate from the chatbot collection if no file is uploaded
+            answer = await generate_answer(GenerationRequest(query=query, stream=stream))
+            response_fields = {"query": query}
+
+        if not answer.found:
+            payload = {"answer": "I don't know the answer."}
+        elif stream:
+            return await answer_response(request, answer, stream, **response_fields)
+        else:
+            payload = {**response_fields, "response": answer.response}
+    except Exception as e:
+        payload = {"error": str(e)}
+
+    # The client expects the JSON payload of the answer as a string
+    return json_response({"response": dumps(payload)})
+
+
+@routes.post('/api/upload_audio', name="audio")
+async def audio(request):
+    """
+    Route to handle audio file uploads and transcribe them.
+    """
+    _, files = await read_form(request)
+    # ffmpeg needs the recording on disk. Every upload gets its own temporary directory, removed once it is
+    # transcribed, so concurrent uploads with the same name never overwrite each other.
+    with tempfile.TemporaryDirectory(prefix="audio_upload_") as upload_dir:
+        try:
+            if 'audio' not in files:
+                return json_response({"error": "No audio file provided."}, status=400)
+            if files['audio'] is None:
+                return json_response({"error": "Empty file uploaded."}, status=400)
+
+            filename, buffer = files['audio']
+            file_path = os.path.join(upload_dir, filename or "recording")
+            await asyncio.to_thread(save_file, buffer, file_path)
+            content_hash = buffer.content_hash
+        finally:
+            close_uploads(files)
+
+        try:
+            transcription = await transcribe_audio(TranscriptionRequest(file_path=file_path, content_hash=content_hash))
+            payload = {"transcription": transcription.text}
+        except Exception as e:
+            payload = {"error": str(e)}
+    return json_response({"response": dumps(payload)})
+
+
+@routes.post('/api/generation/generate', name="generation.generate")
+async def generation_generate(request):
+    """
+    Endpoint to generate an answer using retrieved documents and a language model.
+    """
+    try:
+        data = await read_json(request)
+        if data is None:
+            return json_response({"error": "Request must be JSON"}, status=415)
+
+        query = data.get("query", "What is the purpose of this document?")
+        stream = wants_stream(request, data.get("stream"))
+        answer = await generate_answer(GenerationRequest(query=query, stream=stream))
+
+        if not answer.found:
+            return json_response({"answer": "I don't know the answer."})
+
+        return await answer_response(request, answer, stream, query=query)
+
+    except Exception as e:
+        return json_response({"error": str(e)}, status=500)
+
+
+@routes.get('/api/generation/cache_stats', name="generation.cache_stats")
+async def generation_cache_stats(request):
+    """
+    Endpoint to report the size and hit/miss counters of the query caches.
+    """
+    return json_response({
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "answer_cache": answer_cache.stats()
+    })
+
+
+@routes.get('/api/generation/model_stats', name="generation.get_model_stats")
+async def generation_model_stats(request):
+    """
+    Endpoint to report the calls, recent latencies and token counts of every LLM, for tuning the model routing.
+    """
+    return json_response(model_stats.stats())
+
+
+@routes.post('/api/retrieval/retrieve', name="retrieval.retrieve")
+async def retrieval_retrieve(request):
+    """
+    Endpoint to retrieve relevant documents from Qdrant based on a query.
+    """
+    data = await read_json(request) or {}
+    query = data.get("query", "What is the purpose of this document?")
+    results = await aretrieve_documents(query)
+    return json_response({"query": query, "results": serialize_documents(results)})
+
+
+@routes.post('/api/retrieval/retrieve_batch', name="retrieval.retrieve_batch")
+async def retrieval_retrieve_batch(request):
+    """
+    Endpoint to retrieve relevant documents for a list of queries in one request. The batch is one embedding
+    pass and one Qdrant request, run on a worker thread.
+    """
+    try:
+        queries, k, score_threshold = parse_retrieve_batch(await read_json(request) or {})
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=400)
+
+    results = await asyncio.to_thread(retrieve_documents_batch, queries, k=k, score_threshold=score_threshold)
+    return json_response({"results": [
+        {"query": query, "results": serialize_documents(docs)} for query, docs in zip(queries, results)
+    ]})
+
+
+@routes.post('/api/chat_with_pdf/generate', name="chat_with_pdf.generate")
+async def chat_with_pdf_generate(request):
+    """
+    Endpoint to process a PDF file and query, then generate a response.
+    """
+    try:
+        data = await read_json(request)
+        if data is None:
+            return json_response({"error": "Request must be JSON"}, status=415)
+
+        stream = wants_stream(request, data.get("stream"))
+        answer = await chat_with_pdf(ChatWithPdfRequest(query=data.get("query"), file_path=data.get("file"), stream=stream))
+        return await answer_response(request, answer, stream)
+
+    except InvalidRequestError as e:
+        return json_response({"error": str(e)}, status=400)
+    except Exception as e:
+        return json_response({"error": str(e)}, status=500)
+
+
+@routes.get('/api/chat_with_pdf/cache_stats', name="chat_with_pdf.cache_stats")
+async def chat_with_pdf_cache_stats(request):
+    """
+    Endpoint to report the size and hit/miss counters of the uploaded PDF index cache.
+    """
+    return json_response({"upload_index_cache": upload_index_cache.stats()})
+
+
+@routes.post('/api/audio_conversion/convert', name="audio_conversion.convert_audio_to_text")
+async def audio_conversion_convert(request):
+    """
+    Converts uploaded audio file to text using Groq API.
+    """
+    data = await read_json(request) or {}
+
+    try:
+        transcription = await transcribe_audio(TranscriptionRequest(file_path=data.get("file")))
+        return json_response({"transcription": transcription.text})
+
+    except InvalidRequestError as e:
+        return json_response({"error": str(e)}, status=400)
+    except Exception as e:
+        return json_response({"error": str(e)}, status=500)
+
+
+app = web.Application(middlewares=[timing_middleware], client_max_size=MAX_CONTENT_LENGTH)
+app.add_routes(routes)
+app.on_response_prepare.append(add_headers)
+
+
+if __name__ == "__main__":
+    if config.PRELOAD_MODEL and config.WARMUP_ON_BOOT:
+        start_warmup()
+    web.run_app(app, host="127.0.0.1", port=5000)
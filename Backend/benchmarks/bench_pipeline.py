@@ -0,0 +1,233 @@
+"""
+Offline stage-level benchmarks for the ingestion and RAG pipelines.
+
+Runs against the real PDFs in `data/`, with Qdrant in local in-memory mode and a deterministic fake LLM in place
+of Groq, so no credentials are needed. Run from the Backend folder:
+
+    python -m benchmarks.bench_pipeline --output bench_results.json --baseline previous_results.json
+"""
+from qdrant_client import QdrantClient # type: ignore
+from qdrant_client.http.models import PointStruct # type: ignore
+from langchain_community.document_loaders import PyPDFLoader # type: ignore
+from langchain.text_splitter import RecursiveCharacterTextSplitter # type: ignore
+from langchain_core.embeddings import DeterministicFakeEmbedding # type: ignore
+from uuid import uuid4
+import numpy as np # type: ignore
+import subprocess
+import argparse
+import json
+import time
+import os
+
+SAMPLE_QUERIES = [
+    "What is the hostel fee for first year students?",
+    "What are the MHT-CET cutoffs for Computer Engineering?",
+    "Which companies recruit from the IT department?",
+    "What is the fee structure for BTech 2024-25?",
+    "Tell me about the AI and Data Science department.",
+    "How do I apply for PhD admission?",
+    "What are the placement statistics of the Chemical department?",
+    "Which student clubs are there on campus?",
+    "What scholarships are available?",
+    "What is the syllabus of the first year BTech?",
+]
+
+
+def latency_stats(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "count": len(latencies),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "mean_ms": float(latencies.mean()),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_parse_and_split(pdf_files, data_folder):
+    """
+    Measures PDF parsing (pages/s) and chunk splitting (chunks/s) on a single core.
+    """
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    pages, chunks = [], []
+    parse_time = split_time = 0.0
+    for pdf_file in pdf_files:
+        docs, elapsed = timed(PyPDFLoader(file_path=os.path.join(data_folder, pdf_file)).load)
+        parse_time += elapsed
+        pages.extend(docs)
+        file_chunks, elapsed = timed(text_splitter.split_documents, docs)
+        split_time += elapsed
+        chunks.extend(file_chunks)
+
+    return chunks, {
+        "parse": {"files": len(pdf_files), "pages": len(pages), "seconds": parse_time, "pages_per_s": len(pages) / parse_time},
+        "split": {"chunks": len(chunks), "seconds": split_time, "chunks_per_s": len(chunks) / split_time},
+    }
+
+
+def bench_embed(chunks, embeddings, batch_size):
+    """
+    Measures document embedding throughput (chunks/s).
+    """
+    texts = [chunk.page_content for chunk in chunks]
+    vectors = []
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        vectors.extend(embeddings.embed_documents(texts[i:i + batch_size]))
+    elapsed = time.perf_counter() - start
+    return vectors, {"chunks": len(texts), "batch_size": batch_size, "seconds": elapsed, "chunks_per_s": len(texts) / elapsed}
+
+
+def bench_upsert(client, chunks, vectors, batch_size):
+    """
+    Measures the upsert rate (points/s) into a fresh in-memory collection.
+    """
+    from api.ingestion import create_collection_if_not_exists, drop_collection, upsert_points
+
+    drop_collection(client)
+    create_collection_if_not_exists(client)
+
+    points = [
+        PointStruct(id=uuid4().hex, vector=vector, payload={"page_content": chunk.page_content, "metadata": chunk.metadata})
+        for chunk, vector in zip(chunks, vectors)
+    ]
+    start = time.perf_counter()
+    for i in range(0, len(points), batch_size):
+        upsert_points(client, points[i:i + batch_size])
+    elapsed = time.perf_counter() - start
+    return {"points": len(points), "batch_size": batch_size, "seconds": elapsed, "points_per_s": len(points) / elapsed}
+
+
+def bench_ingest(client, data_folder):
+    """
+    Measures an end-to-end ingest() of `data_folder` into an empty collection, and a no-op re-ingest.
+    """
+    from api.ingestion import drop_collection, ingest
+    from config import config
+
+    drop_collection(client)
+    _, full = timed(ingest, data_folder)
+    _, noop = timed(ingest, data_folder)
+    return {"seconds": full, "points": client.count(config.COLLECTION_NAME).count, "noop_seconds": noop}
+
+
+def bench_queries(queries, repeats, pdf_path):
+    """
+    Measures query latency of every RAG stage, with the query caches cleared before every call.
+    """
+    from api.retrieval import get_retriever
+    from api.common import run_chain, get_prompt_template
+    from api.context_packer import pack_context
+    from api.cache import answer_cache, query_embedding_cache
+    from api.services import GenerationRequest, ChatWithPdfRequest, generate_answer, chat_with_pdf
+
+    def clear_caches():
+        answer_cache.clear()
+        query_embedding_cache.clear()
+
+    stages = {"retrieve": [], "pack_context": [], "context_tokens_saved": [], "run_chain": [], "generation": [], "generation_cached": [], "chat_with_pdf": []}
+    for _ in range(repeats):
+        for query in queries:
+            clear_caches()
+            docs, elapsed = timed(get_retriever().get_relevant_documents, query)
+            stages["retrieve"].append(elapsed)
+            packed, elapsed = timed(pack_context, docs)
+            stages["pack_context"].append(elapsed)
+            stages["context_tokens_saved"].append(packed.tokens_saved)
+            _, elapsed = timed(run_chain, get_prompt_template("generation"), {"context": packed.text, "question": query})
+            stages["run_chain"].append(elapsed)
+
+            clear_caches()
+            _, elapsed = timed(generate_answer, GenerationRequest(query=query))
+            stages["generation"].append(elapsed)
+            _, elapsed = timed(generate_answer, GenerationRequest(query=query))
+            stages["generation_cached"].append(elapsed)
+
+            clear_caches()
+            _, elapsed = timed(chat_with_pdf, ChatWithPdfRequest(query=query, file_path=pdf_path))
+            stages["chat_with_pdf"].append(elapsed)
+
+    tokens_saved = stages.pop("context_tokens_saved")
+    results = {name: latency_stats(latencies) for name, latencies in stages.items()}
+    results["pack_context"]["mean_tokens_saved"] = float(np.mean(tokens_saved))
+    return results
+
+
+def compare(results, baseline):
+    """
+    Prints the relative change of every metric against a previous results file.
+    """
+    print(f"\nComparison against {baseline.get('commit', 'baseline')}:")
+    for stage, metrics in results["stages"].items():
+        for name, value in metrics.items():
+            previous = baseline.get("stages", {}).get(stage, {}).get(name)
+            if isinstance(value, (int, float)) and isinstance(previous, (int, float)) and previous:
+                print(f"  {stage}.{name}: {previous:.3f} -> {value:.3f} ({(value - previous) / previous * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="data", help="Folder with the PDF corpus.")
+    parser.add_argument("--files", type=int, default=None, help="Only use the first N PDFs.")
+    parser.add_argument("--repeats", type=int, default=3, help="Passes over the sample queries.")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Latency of the fake LLM in seconds.")
+    parser.add_argument("--fake-embeddings", action="store_true", help="Use deterministic fake embeddings instead of FastEmbed.")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the results.")
+    parser.add_argument("--baseline", default=None, help="Previous results file to compare against.")
+    args = parser.parse_args()
+
+    # Wire the local stand-ins before any pipeline code touches the registry
+    from api.resources import register_resource, get_embeddings
+    from benchmarks.fakes import FakeChatModel
+    from config import config
+
+    client = QdrantClient(":memory:")
+    register_resource("qdrant_client", client)
+    register_resource(f"chat_model:{config.MODEL_NAME}", FakeChatModel(latency=args.llm_latency))
+    register_resource(f"chat_model:{config.FAST_MODEL_NAME}", FakeChatModel(latency=args.llm_latency / 4))
+    if args.fake_embeddings:
+        register_resource("embeddings", DeterministicFakeEmbedding(size=384))
+    embeddings = get_embeddings()
+
+    pdf_files = sorted(f for f in os.listdir(args.data) if f.endswith(".pdf"))[:args.files]
+    print(f"Benchmarking with {len(pdf_files)} PDF files...")
+
+    chunks, stages = bench_parse_and_split(pdf_files, args.data)
+    vectors, stages["embed"] = bench_embed(chunks, embeddings, config.EMBED_BATCH_SIZE)
+    stages["upsert"] = bench_upsert(client, chunks, vectors, config.UPSERT_BATCH_SIZE)
+    if args.files is None:
+        stages["ingest"] = bench_ingest(client, args.data)
+    stages.update(bench_queries(SAMPLE_QUERIES, args.repeats, os.path.join(args.data, pdf_files[0])))
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    results = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "files": len(pdf_files), "repeats": args.repeats, "llm_latency": args.llm_latency,
+            "fake_embeddings": args.fake_embeddings, "ingest_workers": config.INGEST_WORKERS,
+        },
+        "stages": stages,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for stage, metrics in stages.items():
+        print(f"{stage}: " + ", ".join(f"{name}={value:.3f}" if isinstance(value, float) else f"{name}={value}" for name, value in metrics.items()))
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+from langchain_core.language_models.chat_models import BaseChatModel # type: ignore
+from langchain_core.messages import AIMessage, AIMessageChunk # type: ignore
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult # type: ignore
+from types import SimpleNamespace
+import asyncio
+import hashlib
+import time
+
+# Local stand-ins for the hosted services, so the pipelines can be measured without Groq or Qdrant Cloud credentials.
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model that answers after a configurable latency.
+
+    The answer only depends on the prompt, and streaming yields it word by word at `tokens_per_second`; the streamed
+    words add up to the same answer.
+    """
+
+    latency: float = 0.5
+    tokens_per_second: float = 200.0
+    answer_words: int = 60
+
+    @property
+    def _llm_type(self):
+        return "fake-chat-model"
+
+    def _answer(self, messages):
+        digest = hashlib.sha256("".join(str(message.content) for message in messages).encode("utf-8")).hexdigest()
+        words = [digest[i % len(digest):i % len(digest) + 6] for i in range(self.answer_words)]
+        return "Details: " + " ".join(words)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        answer = self._answer(messages)
+        time.sleep(self.latency + self.answer_words / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for i, word in enumerate(self._answer(messages).split(" ")):
+            time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=(" " if i else "") + word))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        answer = self._answer(messages)
+        await asyncio.sleep(self.latency + self.answer_words / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for i, word in enumerate(self._answer(messages).split(" ")):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=(" " if i else "") + word))
+
+
+class FakeGroqClient:
+    """
+    Stand-in for the Groq client's Whisper endpoint. Transcribes any audio after `latency` seconds into a text
+    derived from its content, so identical uploads get identical transcripts.
+    """
+
+    def __init__(self, latency=1.0):
+        self.latency = latency
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self._transcribe))
+
+    def _transcribe(self, file, model=None, response_format=None, **kwargs):
+        _, f = file
+        digest = hashlib.sha256(f.read()).hexdigest()
+        time.sleep(self.latency)
+        return SimpleNamespace(text=f"Transcript of recording {digest[:12]}.")
+
+
+class FakeAsyncGroqClient(FakeGroqClient):
+    """
+    AsyncGroq counterpart of `FakeGroqClient`, for the async serving mode.
+    """
+
+    async def _transcribe(self, file, model=None, response_format=None, **kwargs):
+        _, f = file
+        digest = hashlib.sha256(f if isinstance(f, bytes) else f.read()).hexdigest()
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(text=f"Transcript of recording {digest[:12]}.")
+
+
+class ThreadedAsyncQdrantClient:
+    """
+    Exposes the search of a synchronous Qdrant client, e.g. one in in-memory mode, with the interface of
+    AsyncQdrantClient. An in-memory AsyncQdrantClient would hold a separate collection.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    async def search(self, **kwargs):
+        return await asyncio.to_thread(self.client.search, **kwargs)
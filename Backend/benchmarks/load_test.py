@@ -0,0 +1,349 @@
+"""
+Concurrent load test of the HTTP API.
+
+Replays a weighted mix of requests against the HTTP routes at increasing request rates and reports the
+throughput, p50/p90/p99 latency, error rate and saturation point of every route. By default the app is started
+in-process on a local port, wired to Qdrant in in-memory mode (loaded with PDFs from `data/`), a fake LLM and a
+fake Whisper client, so no credentials are needed. Run from the Backend folder:
+
+    python -m benchmarks.load_test --rps 2,5,10,20 --duration 20 --concurrency 32 --output load_results.json
+
+Pass `--async-app` to serve the async mode (async_app.py) instead of the Flask app. Use `--url` to load an already running server instead; chat_with_pdf then needs the same `data/` folder on the
+server. Latencies are measured from the time a request was scheduled, so queueing behind a saturated server
+counts against it.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Thread
+import numpy as np # type: ignore
+import subprocess
+import argparse
+import logging
+import random
+import wave
+import json
+import time
+import io
+import os
+
+from benchmarks.bench_pipeline import SAMPLE_QUERIES
+
+ROUTES = ("query", "query_pdf", "generation", "retrieve", "chat_with_pdf", "upload_audio")
+DEFAULT_MIX = "query=4,query_pdf=1,generation=2,retrieve=2,chat_with_pdf=1,upload_audio=1"
+
+
+def parse_mix(mix):
+    """
+    Parses "route=weight,..." into a dict of route weights.
+    """
+    weights = {}
+    for item in mix.split(","):
+        route, _, weight = item.partition("=")
+        if route.strip() not in ROUTES:
+            raise ValueError(f"Unknown route {route!r}, expected one of {', '.join(ROUTES)}.")
+        weights[route.strip()] = float(weight or 1)
+    return weights
+
+
+def make_audio_clips(count, seconds=2, sample_rate=16000, seed=0):
+    """
+    Builds `count` distinct mono WAV recordings of noise, as bytes.
+    """
+    rng = np.random.default_rng(seed)
+    clips = []
+    for _ in range(count):
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            f.writeframes((rng.standard_normal(seconds * sample_rate) * 3000).astype(np.int16).tobytes())
+        clips.append(buffer.getvalue())
+    return clips
+
+
+class RequestFactory:
+    """
+    Builds the HTTP requests of every route from the sample queries, the PDFs and generated audio clips.
+    """
+
+    def __init__(self, data_folder, pdf_files, audio_clips, unique_queries, seed):
+        self.data_folder = data_folder
+        self.pdf_files = pdf_files
+        self.pdf_bytes = {}
+        self.audio_clips = audio_clips
+        self.unique_queries = unique_queries
+        self.rng = random.Random(seed)
+        self.lock = Lock()
+        self.counter = 0
+
+    def _query(self):
+        with self.lock:
+            self.counter += 1
+            query = self.rng.choice(SAMPLE_QUERIES)
+            # A unique suffix defeats the query and answer caches, to measure the full pipeline
+            return f"{query} (request {self.counter})" if self.unique_queries else query
+
+    def _pdf(self):
+        with self.lock:
+            pdf_file = self.rng.choice(self.pdf_files)
+        if pdf_file not in self.pdf_bytes:
+            with open(os.path.join(self.data_folder, pdf_file), "rb") as f:
+                self.pdf_bytes[pdf_file] = f.read()
+        return pdf_file, self.pdf_bytes[pdf_file]
+
+    def build(self, route):
+        """
+        Returns the method, path and httpx keyword arguments of a request to `route`.
+        """
+        if route == "query":
+            return "POST", "/api/query", {"data": {"query": self._query()}}
+        if route == "query_pdf":
+            pdf_file, content = self._pdf()
+            return "POST", "/api/query", {"data": {"query": self._query()}, "files": {"file": (pdf_file, content, "application/pdf")}}
+        if route == "generation":
+            return "POST", "/api/generation/generate", {"json": {"query": self._query()}}
+        if route == "retrieve":
+            return "POST", "/api/retrieval/retrieve", {"json": {"query": self._query()}}
+        if route == "chat_with_pdf":
+            pdf_file, _ = self._pdf()
+            return "POST", "/api/chat_with_pdf/generate", {"json": {"file": f"{self.data_folder}/{pdf_file}", "query": self._query()}}
+        if route == "upload_audio":
+            with self.lock:
+                index = self.rng.randrange(len(self.audio_clips))
+            return "POST", "/api/upload_audio", {"files": {"audio": (f"recording_{index}.wav", self.audio_clips[index], "audio/wav")}}
+        raise ValueError(f"Unknown route {route}")
+
+
+def is_error(response):
+    """
+    Checks a response for errors. /api/query and /api/upload_audio report failures with status 200 and an
+    "error" key in the JSON string of their "response" field.
+    """
+    if response.status_code >= 400:
+        return True
+    try:
+        payload = response.json()
+    except ValueError:
+        return True
+    if isinstance(payload, dict) and isinstance(payload.get("response"), str):
+        try:
+            payload = json.loads(payload["response"])
+        except ValueError:
+            return False
+    return isinstance(payload, dict) and "error" in payload
+
+
+def percentiles(values):
+    values = np.asarray(values) * 1000
+    if not len(values):
+        return {"p50_ms": None, "p90_ms": None, "p99_ms": None, "mean_ms": None}
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p90_ms": float(np.percentile(values, 90)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+    }
+
+
+def run_step(client, factory, weights, rps, duration, concurrency, rng):
+    """
+    Sends requests with Poisson arrivals at `rps` for `duration` seconds through at most `concurrency`
+    connections, and returns the per-route results of the step.
+    """
+    results = []  # (route, latency, queue wait, error)
+    results_lock = Lock()
+    routes, route_weights = list(weights), list(weights.values())
+
+    def send(route, scheduled):
+        started = time.perf_counter()
+        method, path, kwargs = factory.build(route)
+        try:
+            error = is_error(client.request(method, path, **kwargs))
+        except Exception:
+            error = True
+        finished = time.perf_counter()
+        with results_lock:
+            results.append((route, finished - scheduled, started - scheduled, error))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        scheduled = start
+        while True:
+            scheduled += rng.expovariate(rps)
+            if scheduled - start > duration:
+                break
+            time.sleep(max(scheduled - time.perf_counter(), 0))
+            executor.submit(send, rng.choices(routes, route_weights)[0], scheduled)
+    elapsed = time.perf_counter() - start
+
+    step = {"offered_rps": rps, "completed": len(results), "achieved_rps": len(results) / elapsed, "routes": {}}
+    for route in routes:
+        route_results = [result for result in results if result[0] == route]
+        errors = sum(1 for result in route_results if result[3])
+        step["routes"][route] = {
+            "requests": len(route_results),
+            "throughput_rps": len(route_results) / elapsed,
+            "error_rate": errors / len(route_results) if route_results else 0.0,
+            **percentiles([result[1] for result in route_results]),
+            "queue_wait_p99_ms": percentiles([result[2] for result in route_results])["p99_ms"],
+        }
+    return step
+
+
+def find_saturation(steps, slo_ms, max_error_rate):
+    """
+    Returns, per route, the highest offered rate that kept p99 within `slo_ms` and the error rate within
+    `max_error_rate`, and the first rate that did not. A step where requests waited more than half the SLO
+    for a free connection also counts as saturated: the server no longer keeps up with the arrivals.
+    """
+    saturation = {}
+    for route in steps[0]["routes"]:
+        sustained, saturated_at = None, None
+        for step in steps:
+            stats = step["routes"][route]
+            if not stats["requests"]:
+                continue
+            if stats["p99_ms"] > slo_ms or stats["error_rate"] > max_error_rate or stats["queue_wait_p99_ms"] > slo_ms / 2:
+                saturated_at = step["offered_rps"]
+                break
+            sustained = step["offered_rps"]
+        saturation[route] = {"max_sustained_rps": sustained, "saturated_at_rps": saturated_at}
+    return saturation
+
+
+def start_local_server(args):
+    """
+    Wires the in-memory Qdrant client and the fake LLM and Whisper clients, loads the PDFs and serves the app on a
+    free local port. Returns the base URL.
+    """
+    os.environ.setdefault("WARMUP_ON_BOOT", "false")
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    from qdrant_client import QdrantClient # type: ignore
+    from langchain_core.embeddings import DeterministicFakeEmbedding # type: ignore
+    from werkzeug.serving import make_server # type: ignore
+    from api.resources import register_resource, get_embedding_executor
+    from api.ingestion import create_collection_if_not_exists, run_pipeline
+    from api.page_store import get_pdf_content_hash
+    from benchmarks.fakes import FakeChatModel, FakeGroqClient, FakeAsyncGroqClient, ThreadedAsyncQdrantClient
+    from config import config
+
+    client = QdrantClient(":memory:")
+    register_resource("qdrant_client", client)
+    register_resource(f"chat_model:{config.MODEL_NAME}", FakeChatModel(latency=args.llm_latency))
+    register_resource(f"chat_model:{config.FAST_MODEL_NAME}", FakeChatModel(latency=args.llm_latency / 4))
+    register_resource("groq_client", FakeGroqClient(latency=args.whisper_latency))
+    register_resource("async_qdrant_client", ThreadedAsyncQdrantClient(client))
+    register_resource("async_groq_client", FakeAsyncGroqClient(latency=args.whisper_latency))
+    if args.fake_embeddings:
+        register_resource("embeddings", DeterministicFakeEmbedding(size=384))
+
+    print(f"Loading {len(args.pdf_files)} PDF files into the in-memory collection...")
+    create_collection_if_not_exists(client)
+    run_pipeline(
+        {f: get_pdf_content_hash(os.path.join(args.data, f)) for f in args.pdf_files},
+        args.data, client, get_embedding_executor()
+    )
+
+    if args.async_app:
+        return start_async_server()
+
+    from app import app
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    Thread(target=server.serve_forever, name="load-test-server", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def start_async_server():
+    """
+    Serves the async app on a free local port, on an event loop running in a background thread.
+    """
+    import asyncio
+    from aiohttp import web # type: ignore
+    from async_app import app
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app, access_log=None)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", 0).start())
+    Thread(target=loop.run_forever, name="load-test-server", daemon=True).start()
+    return f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+
+def print_report(steps, saturation):
+    header = f"{'route':<14}{'rps':>7}{'req':>6}{'thru/s':>8}{'err%':>7}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'wait99':>9}"
+    for step in steps:
+        print(f"\nOffered {step['offered_rps']} rps, achieved {step['achieved_rps']:.2f} rps")
+        print(header)
+        for route, stats in step["routes"].items():
+            if not stats["requests"]:
+                continue
+            print(
+                f"{route:<14}{step['offered_rps']:>7}{stats['requests']:>6}{stats['throughput_rps']:>8.2f}"
+                f"{stats['error_rate'] * 100:>7.1f}{stats['p50_ms']:>9.0f}{stats['p90_ms']:>9.0f}{stats['p99_ms']:>9.0f}"
+                f"{stats['queue_wait_p99_ms']:>9.0f}"
+            )
+    print("\nSaturation:")
+    for route, points in saturation.items():
+        print(f"  {route}: sustained {points['max_sustained_rps']} rps, saturated at {points['saturated_at_rps']} rps")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="Base URL of a running server. Starts a local one with fakes if omitted.")
+    parser.add_argument("--data", default="data", help="Folder with the PDF corpus.")
+    parser.add_argument("--files", type=int, default=5, help="PDFs loaded into the collection and uploaded.")
+    parser.add_argument("--rps", default="2,5,10,20", help="Comma-separated request rates, one step each.")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per step.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Maximum requests in flight.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Route weights, e.g. query=4,retrieve=2.")
+    parser.add_argument("--unique-queries", action="store_true", help="Make every query unique to bypass the caches.")
+    parser.add_argument("--audio-clips", type=int, default=8, help="Distinct recordings uploaded to /api/upload_audio.")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Latency of the fake LLM in seconds.")
+    parser.add_argument("--whisper-latency", type=float, default=1.0, help="Latency of the fake Whisper API in seconds.")
+    parser.add_argument("--async-app", action="store_true", help="Serve the async mode (async_app.py) instead of the Flask app.")
+    parser.add_argument("--fake-embeddings", action="store_true", help="Use deterministic fake embeddings instead of FastEmbed.")
+    parser.add_argument("--slo-ms", type=float, default=2000, help="p99 latency above which a route counts as saturated.")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Error rate above which a route counts as saturated.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_results.json", help="Where to write the results.")
+    args = parser.parse_args()
+
+    import httpx # type: ignore
+
+    weights = parse_mix(args.mix)
+    args.pdf_files = sorted(f for f in os.listdir(args.data) if f.endswith(".pdf"))[:args.files]
+    base_url = args.url or start_local_server(args)
+    factory = RequestFactory(args.data, args.pdf_files, make_audio_clips(args.audio_clips, seed=args.seed), args.unique_queries, args.seed)
+    rng = random.Random(args.seed)
+
+    steps = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    with httpx.Client(base_url=base_url, timeout=120, limits=limits) as client:
+        for rps in [float(rate) for rate in args.rps.split(",")]:
+            print(f"Running {rps} rps for {args.duration} seconds against {base_url}...")
+            steps.append(run_step(client, factory, weights, rps, args.duration, args.concurrency, rng))
+    saturation = find_saturation(steps, args.slo_ms, args.max_error_rate)
+    print_report(steps, saturation)
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    results = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "url": args.url, "async_app": args.async_app, "files": len(args.pdf_files), "duration": args.duration, "concurrency": args.concurrency,
+            "mix": weights, "unique_queries": args.unique_queries, "llm_latency": args.llm_latency,
+            "whisper_latency": args.whisper_latency, "fake_embeddings": args.fake_embeddings, "slo_ms": args.slo_ms,
+        },
+        "steps": steps,
+        "saturation": saturation,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
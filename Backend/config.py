@@ -7,10 +7,57 @@ class Config:
     QDRANT_URL = os.getenv("QDRANT_URL")
     QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
     COLLECTION_NAME = "chatbot"
-    TEMP_COLLECTION_NAME = "user_collection"
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")  # "qdrant" or "local" (memory-mapped index in LOCAL_INDEX_DIR)
+    LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+    LOCAL_INDEX_QUANTIZATION = os.getenv("LOCAL_INDEX_QUANTIZATION") or None  # None, "int8" or "float16"
+    LOCAL_INDEX_RESCORE_FACTOR = int(os.getenv("LOCAL_INDEX_RESCORE_FACTOR", "4"))  # Quantized candidates rescored exactly per result
     #MODEL_NAME = "mistral" #use this when using ollama
     MODEL_NAME = "llama-3.1-70b-versatile"  # Related to the retrieval part
+    FAST_MODEL_NAME = os.getenv("FAST_MODEL_NAME", "llama-3.1-8b-instant")  # Auxiliary steps, and hedging when MODEL_NAME is slow
+    MODEL_ROUTES = dict(route.split("=", 1) for route in os.getenv("MODEL_ROUTES", "refined_query=fast,refine_query=fast").split(",") if route)  # use_case=large|fast|<model name>
+    LLM_LATENCY_BUDGET = float(os.getenv("LLM_LATENCY_BUDGET", "8"))  # Seconds until a call (or its first streamed token) is hedged with FAST_MODEL_NAME, 0 to disable
     DEBUG = os.getenv("DEBUG", "True").lower() in ['true', '1', 't']
     GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+    GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "20"))  # Shared Groq HTTP connection pool size
+    WARMUP_ON_BOOT = os.getenv("WARMUP_ON_BOOT", "True").lower() in ['true', '1', 't']
+    PRELOAD_MODEL = os.getenv("PRELOAD_MODEL", "False").lower() in ['true', '1', 't']  # Load the embedding model at import, e.g. in the gunicorn master
+    EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0")) or None  # ONNX Runtime threads per process, all cores if unset
+    EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "128"))  # Texts per micro-batched embedding call
+    EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))  # How long concurrent embed requests are collected into one batch
+    EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "1"))  # Embedding batches running at the same time
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+    QUERY_EMBEDDING_CACHE_TTL = int(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "86400"))  # Seconds
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+    ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))  # Seconds
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # Minimum cosine similarity for a cache hit
+    TRANSCRIPT_CACHE_SIZE = int(os.getenv("TRANSCRIPT_CACHE_SIZE", "256"))
+    TRANSCRIPT_CACHE_TTL = int(os.getenv("TRANSCRIPT_CACHE_TTL", "86400"))  # Seconds
+    REVISION_COLLECTION_NAME = f"{COLLECTION_NAME}_revision"  # Holds the revision marker bumped by ingest() when the chatbot collection changes
+    COLLECTION_REVISION_TTL = float(os.getenv("COLLECTION_REVISION_TTL", "5"))  # Seconds a server reuses the revision it read
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")  # Chunk embeddings, keyed by chunk ID
+    PAGE_STORE_DIR = os.getenv("PAGE_STORE_DIR", "page_store")  # Extracted PDF text, keyed by content hash
+    UPLOAD_INDEX_MAX_BYTES = int(os.getenv("UPLOAD_INDEX_MAX_BYTES", str(256 * 1024 * 1024)))  # Memory cap of the uploaded PDF indexes
+    UPLOAD_INDEX_TTL = int(os.getenv("UPLOAD_INDEX_TTL", "3600"))  # Seconds
+    UPLOAD_SPOOL_MAX_BYTES = int(os.getenv("UPLOAD_SPOOL_MAX_BYTES", str(4 * 1024 * 1024)))  # Uploads above this size are buffered in an anonymous temporary file instead of memory
+    CONCURRENT_CHAT_WITH_PDF = os.getenv("CONCURRENT_CHAT_WITH_PDF", "True").lower() in ['true', '1', 't']
+    SPECULATIVE_SEARCH_THRESHOLD = float(os.getenv("SPECULATIVE_SEARCH_THRESHOLD", "0.9"))  # Minimum cosine similarity to reuse the speculative search
+    STAGE_WORKERS = int(os.getenv("STAGE_WORKERS", "16"))  # Threads running independent request stages
+    AUDIO_SEGMENT_SECONDS = int(os.getenv("AUDIO_SEGMENT_SECONDS", "60"))  # Recordings longer than this are transcribed in concurrent segments
+    AUDIO_SEGMENT_OVERLAP = int(os.getenv("AUDIO_SEGMENT_OVERLAP", "2"))  # Seconds shared by consecutive segments
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))  # Estimated prompt tokens per retrieved context
+    CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))  # Shingle similarity of dropped near-duplicate passages
+    RETRIEVE_BATCH_MAX_QUERIES = int(os.getenv("RETRIEVE_BATCH_MAX_QUERIES", "512"))  # Queries per /retrieve_batch request
+    TIMING_HEADERS = os.getenv("TIMING_HEADERS", "False").lower() in ['true', '1', 't']  # Per-request Server-Timing breakdown
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 2))  # PDF parsing processes
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))  # Chunks per embedding call, across files
+    UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "128"))  # Initial points per Qdrant upsert request, adapted to the observed latency
+    UPSERT_MAX_BATCH_SIZE = int(os.getenv("UPSERT_MAX_BATCH_SIZE", "1024"))
+    UPSERT_MAX_BATCH_BYTES = int(os.getenv("UPSERT_MAX_BATCH_BYTES", str(16 * 1024 * 1024)))  # Below Qdrant's 32 MB request limit
+    UPSERT_TARGET_SECONDS = float(os.getenv("UPSERT_TARGET_SECONDS", "1.0"))  # Upsert request latency the batch size is tuned for
+    UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", "2"))  # Upsert requests in flight while Qdrant keeps up
+    UPSERT_MAX_RETRIES = int(os.getenv("UPSERT_MAX_RETRIES", "5"))
+    UPSERT_RETRY_DELAY = float(os.getenv("UPSERT_RETRY_DELAY", "1.0"))  # Seconds, doubled per attempt and jittered
+    UPSERT_RETRY_MAX_DELAY = float(os.getenv("UPSERT_RETRY_MAX_DELAY", "30"))
+    INGEST_WATCH_INTERVAL = float(os.getenv("INGEST_WATCH_INTERVAL", "10"))  # Seconds between polls of the data folder in watch mode
 
 config = Config()
\ No newline at end of file
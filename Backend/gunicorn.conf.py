@@ -0,0 +1,21 @@
+# Gunicorn settings for serving the API with several worker processes. Run from the Backend folder:
+#
+#     PRELOAD_MODEL=true gunicorn -c gunicorn.conf.py app:app
+#
+# With PRELOAD_MODEL, app.py is imported and the embedding model loaded once in the master; the forked workers
+# share the model's memory pages copy-on-write and only open their own connections after the fork.
+import os
+from config import config as app_config  # Not "config", which gunicorn would read as its own setting
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = 120
+preload_app = app_config.PRELOAD_MODEL
+
+
+def post_fork(server, worker):
+    # Clients, connection pools and thread pools are not fork-safe, so every worker warms up its own
+    if app_config.WARMUP_ON_BOOT:
+        from api.resources import start_warmup
+        start_warmup()
@@ -1,5 +1,18 @@
-from api.ingestion import ingest # type: ignore
+from api.ingestion import ingest, rebuild, watch # type: ignore
+import argparse
 
 if __name__ == "__main__":
-    retriever = ingest()
-    print("Data ingested successfully into Qdrant.")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ingest the PDFs in the data folder into Qdrant.")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the collection from scratch and switch to it atomically.")
+    parser.add_argument("--watch", action="store_true", help="Keep running and ingest new, changed or removed PDFs as they appear.")
+    parser.add_argument("--interval", type=float, default=None, help="Seconds between polls of the data folder in watch mode.")
+    args = parser.parse_args()
+
+    if args.watch:
+        watch(args.interval, rebuild_first=args.rebuild)
+    elif args.rebuild:
+        rebuild()
+        print("Collection rebuilt successfully.")
+    else:
+        retriever = ingest()
+        print("Data ingested successfully into Qdrant.")